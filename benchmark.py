@@ -0,0 +1,211 @@
+import argparse
+import contextlib
+import json
+import multiprocessing
+import os
+import resource
+import statistics
+import sys
+import tempfile
+import traceback
+
+import generate_graph
+import populate_graph
+
+# --- Constants ---
+DEFAULT_SIZES = "10000,100000"
+DEFAULT_RUNS = 3
+DEFAULT_MAX_REGRESSION = 0.15
+STAGES = ("load", "validate", "analytics", "constraints", "nodes", "edges")
+
+
+# --- Configuration & Argument Parsing ---
+
+def parse_arguments():
+    """Parses command-line arguments; everything after `--` is passed to populate_graph."""
+    argv = sys.argv[1:]
+    populate_args = []
+    if "--" in argv:
+        split = argv.index("--")
+        argv, populate_args = argv[:split], argv[split + 1:]
+    parser = argparse.ArgumentParser(
+        description="Benchmark populate_graph.py on synthetic RoslynCodeAnalyzer-style graphs. "
+                    "Arguments after `--` are passed to populate_graph (default: --sink memory).")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES,
+                        help=f"Comma-separated approximate node counts to benchmark (default: {DEFAULT_SIZES}).")
+    parser.add_argument("--runs", type=int, default=DEFAULT_RUNS,
+                        help=f"Runs per size; the median is reported (default: {DEFAULT_RUNS}).")
+    parser.add_argument("--seed", type=int, default=42, help="Generator seed (default: 42).")
+    parser.add_argument("--duplicate-rate", type=float, default=generate_graph.DEFAULT_DUPLICATE_RATE,
+                        help="Share of classes the generator emits twice (default: "
+                             f"{generate_graph.DEFAULT_DUPLICATE_RATE}).")
+    parser.add_argument("--work-dir",
+                        default=os.path.join(tempfile.gettempdir(), "populate_graph_bench"),
+                        help="Where generated inputs are cached (default: a directory in the system temp dir).")
+    parser.add_argument("--json", dest="json_path", help="Write the results to this JSON file.")
+    parser.add_argument("--baseline",
+                        help="Results JSON of an earlier run; exit with status 1 if throughput regressed.")
+    parser.add_argument("--max-regression", type=float, default=DEFAULT_MAX_REGRESSION,
+                        help="Tolerated relative drop in nodes/s or edges/s against --baseline "
+                             f"(default: {DEFAULT_MAX_REGRESSION}).")
+    args = parser.parse_args(argv)
+    args.sizes = [int(size) for size in args.sizes.split(",") if size.strip()]
+    args.populate_args = populate_args or ["--sink", "memory"]
+    if args.runs < 1:
+        parser.error("--runs must be at least 1.")
+    return args
+
+
+# --- Benchmark Run ---
+
+def generated_input(work_dir, nodes, seed, duplicate_rate):
+    """Returns the path of a generated graph of about `nodes` nodes, generating it on first use."""
+    os.makedirs(work_dir, exist_ok=True)
+    path = os.path.join(work_dir, f"graph_{nodes}_{seed}_{duplicate_rate}.json")
+    if not os.path.exists(path):
+        print(f"Generating input with about {nodes} nodes: {path}", file=sys.stderr)
+        namespaces = generate_graph.namespaces_for(
+            nodes, generate_graph.DEFAULT_CLASSES_PER_NAMESPACE, generate_graph.DEFAULT_METHODS_PER_CLASS)
+        with open(path + ".tmp", 'w', encoding='utf-8') as out, \
+                open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            generate_graph.generate_graph(out, namespaces=namespaces, seed=seed, duplicate_rate=duplicate_rate)
+        os.replace(path + ".tmp", path)
+    return path
+
+def _peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+def run_import(input_file, populate_args):
+    """Runs populate_graph's import in this process and returns its stage timings.
+
+    The timings come from the ImportMetrics of populate_graph.run_import, so
+    the benchmark measures exactly what the script does. In --stream mode
+    parsing happens lazily, so its cost shows up in the stages that read the
+    input.
+    """
+    sys.argv = ["populate_graph.py", input_file] + populate_args
+    args = populate_graph.parse_arguments()
+    metrics = populate_graph.ImportMetrics()
+    status = populate_graph.run_import(args, metrics)
+    if status != 0:
+        raise RuntimeError(f"populate_graph exited with status {status}")
+    report = metrics.report()
+    phases = report["phases"]
+    timings = {stage: report["stages"].get(stage, 0.0) for stage in STAGES}
+    for phase in ("nodes", "edges"):
+        timings[phase] = phases[phase]["seconds"] if phase in phases else 0.0
+    return {
+        "node_count": phases["nodes"]["rows"] if "nodes" in phases else 0,
+        "edge_count": phases["edges"]["rows"] if "edges" in phases else 0,
+        "total": report["duration_seconds"],
+        "stages": timings,
+    }
+
+def _worker(input_file, populate_args, results):
+    """Entry point of a benchmark child process; reports one run through the results queue."""
+    with open(os.devnull, 'w') as devnull, \
+            contextlib.redirect_stdout(devnull), contextlib.redirect_stderr(devnull):
+        try:
+            result = run_import(input_file, populate_args)
+        except BaseException:
+            results.put({"error": traceback.format_exc()})
+            return
+    result["peak_rss_mb"] = _peak_rss_mb()
+    results.put(result)
+
+def measure(input_file, populate_args):
+    """Runs one import in a fresh process, so peak RSS covers exactly that run."""
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    process = context.Process(target=_worker, args=(input_file, populate_args, results))
+    process.start()
+    result = results.get()
+    process.join()
+    if "error" in result:
+        raise RuntimeError(f"Benchmark run failed:\n{result['error']}")
+    return result
+
+
+# --- Reporting ---
+
+def summarize(size, runs):
+    """Reduces several runs of one size to their medians."""
+    total = statistics.median(run["total"] for run in runs)
+    nodes_time = statistics.median(run["stages"]["nodes"] for run in runs)
+    edges_time = statistics.median(run["stages"]["edges"] for run in runs)
+    node_count, edge_count = runs[0]["node_count"], runs[0]["edge_count"]
+    return {
+        "size": size,
+        "nodes": node_count,
+        "edges": edge_count,
+        "total_s": total,
+        "nodes_per_s": node_count / nodes_time if nodes_time else None,
+        "edges_per_s": edge_count / edges_time if edges_time else None,
+        "peak_rss_mb": max(run["peak_rss_mb"] for run in runs),
+        "stages_s": {stage: statistics.median(run["stages"][stage] for run in runs) for stage in STAGES},
+    }
+
+def _rate(value):
+    return f"{value:,.0f}" if value else "-"
+
+def print_table(results):
+    header = (f"{'size':>9} {'nodes':>9} {'edges':>9} {'nodes/s':>10} {'edges/s':>10} {'RSS MB':>8} {'total s':>8}  "
+              + " ".join(f"{stage:>11}" for stage in STAGES))
+    print(header)
+    for row in results:
+        print(f"{row['size']:>9} {row['nodes']:>9} {row['edges']:>9} {_rate(row['nodes_per_s']):>10} "
+              f"{_rate(row['edges_per_s']):>10} {row['peak_rss_mb']:>8.1f} {row['total_s']:>8.2f}  "
+              + " ".join(f"{row['stages_s'][stage]:>11.3f}" for stage in STAGES))
+
+def find_regressions(results, baseline, max_regression):
+    """Returns messages for every size whose throughput fell more than max_regression below the baseline."""
+    previous = {row["size"]: row for row in baseline.get("results", [])}
+    regressions = []
+    for row in results:
+        before = previous.get(row["size"])
+        if before is None:
+            continue
+        for metric in ("nodes_per_s", "edges_per_s"):
+            if before.get(metric) and row[metric] and row[metric] < before[metric] * (1 - max_regression):
+                regressions.append(f"size {row['size']}: {metric} {row[metric]:,.0f} "
+                                   f"< baseline {before[metric]:,.0f} - {max_regression:.0%}")
+    return regressions
+
+
+# --- Main Execution ---
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    print(f"Benchmarking sizes {args.sizes} with populate_graph {' '.join(args.populate_args)}", file=sys.stderr)
+    results = []
+    try:
+        for size in args.sizes:
+            input_file = generated_input(args.work_dir, size, args.seed, args.duplicate_rate)
+            runs = []
+            for run in range(args.runs):
+                runs.append(measure(input_file, args.populate_args))
+                print(f"size {size}: run {run + 1}/{args.runs} took {runs[-1]['total']:.2f}s", file=sys.stderr)
+            results.append(summarize(size, runs))
+    except Exception as e:
+        print(f"Error running benchmark: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    print_table(results)
+    if args.json_path:
+        with open(args.json_path, 'w', encoding='utf-8') as f:
+            json.dump({"populate_args": args.populate_args, "results": results}, f, indent=2)
+        print(f"Results written to {args.json_path}", file=sys.stderr)
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        if baseline.get("populate_args") != args.populate_args:
+            print(f"Warning: the baseline was measured with populate_graph "
+                  f"{' '.join(baseline.get('populate_args', []))}.", file=sys.stderr)
+        regressions = find_regressions(results, baseline, args.max_regression)
+        for message in regressions:
+            print(f"Regression: {message}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+        print("No throughput regressions against the baseline.", file=sys.stderr)
@@ -0,0 +1,223 @@
+import argparse
+import json
+import math
+import random
+import sys
+
+from tqdm import tqdm
+
+# --- Constants ---
+DEFAULT_NAMESPACES = 10
+DEFAULT_CLASSES_PER_NAMESPACE = 20   # Mean; actual counts are log-normally spread
+DEFAULT_METHODS_PER_CLASS = 12       # Mean; actual counts are log-normally spread
+DEFAULT_CALLS_ALPHA = 1.6            # Pareto shape of the CALLS fan-out (lower = heavier tail)
+DEFAULT_MAX_CALLS = 200
+DEFAULT_INHERIT_PROBABILITY = 0.35
+DEFAULT_MAX_INHERITANCE_DEPTH = 6
+DEFAULT_INTERFACE_RATIO = 0.1
+DEFAULT_BODY_CHARS = 300             # Mean length of a method's source text
+DEFAULT_DUPLICATE_RATE = 0.0
+LOCAL_CALL_RATIO = 0.6               # Share of calls that stay within the caller's namespace
+
+WORDS = ("Order", "Invoice", "Customer", "Billing", "Cache", "Repository", "Service", "Handler",
+         "Parser", "Token", "Session", "Report", "Payment", "Account", "Ledger", "Queue",
+         "Event", "Index", "Query", "Schema", "Client", "Server", "Config", "Mapper")
+VERBS = ("Get", "Set", "Load", "Save", "Build", "Parse", "Validate", "Compute", "Handle",
+         "Create", "Update", "Delete", "Find", "Resolve", "Apply", "Render")
+PARAMETER_TYPES = ("int", "string", "bool", "double", "Guid", "DateTime", "CancellationToken")
+ACCESSIBILITY = ("public", "public", "public", "internal", "private", "protected")
+
+
+# --- Configuration & Argument Parsing ---
+
+def parse_arguments():
+    """Parses command-line arguments."""
+    parser = argparse.ArgumentParser(
+        description="Generate a synthetic RoslynCodeAnalyzer-style graph JSON for import benchmarks.")
+    parser.add_argument("output_file", help="Path of the JSON file to write.")
+    parser.add_argument(
+        "--nodes", "-n",
+        type=int,
+        help="Approximate number of nodes to generate; sets --namespaces from the per-namespace means."
+    )
+    parser.add_argument("--namespaces", type=int, default=DEFAULT_NAMESPACES,
+                        help=f"Number of namespaces (default: {DEFAULT_NAMESPACES}).")
+    parser.add_argument("--classes", type=float, default=DEFAULT_CLASSES_PER_NAMESPACE,
+                        help=f"Mean number of types per namespace (default: {DEFAULT_CLASSES_PER_NAMESPACE}).")
+    parser.add_argument("--methods", type=float, default=DEFAULT_METHODS_PER_CLASS,
+                        help=f"Mean number of methods per class (default: {DEFAULT_METHODS_PER_CLASS}).")
+    parser.add_argument("--calls-alpha", type=float, default=DEFAULT_CALLS_ALPHA,
+                        help=f"Pareto shape of the per-method CALLS fan-out (default: {DEFAULT_CALLS_ALPHA}).")
+    parser.add_argument("--max-calls", type=int, default=DEFAULT_MAX_CALLS,
+                        help=f"Upper bound of calls made by one method (default: {DEFAULT_MAX_CALLS}).")
+    parser.add_argument("--max-inheritance-depth", type=int, default=DEFAULT_MAX_INHERITANCE_DEPTH,
+                        help=f"Longest INHERITS_FROM chain (default: {DEFAULT_MAX_INHERITANCE_DEPTH}).")
+    parser.add_argument("--body-chars", type=int, default=DEFAULT_BODY_CHARS,
+                        help=f"Mean length of the source text stored on methods (default: {DEFAULT_BODY_CHARS}).")
+    parser.add_argument("--duplicate-rate", type=float, default=DEFAULT_DUPLICATE_RATE,
+                        help="Share of classes emitted a second time as another partial declaration, "
+                             f"as in multi-project solutions (default: {DEFAULT_DUPLICATE_RATE}).")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed (default: 42).")
+    args = parser.parse_args()
+    if args.nodes is not None:
+        args.namespaces = namespaces_for(args.nodes, args.classes, args.methods)
+    return args
+
+
+# --- Generation ---
+
+def namespaces_for(nodes, classes, methods):
+    """Returns the namespace count that yields roughly `nodes` nodes for the given means."""
+    return max(1, round(nodes / (1 + classes * (1 + methods))))
+
+def _spread(rng, mean):
+    """Draws a positive count around mean with a log-normal spread (sigma 0.6)."""
+    if mean <= 0:
+        return 0
+    return max(1, round(rng.lognormvariate(math.log(mean) - 0.18, 0.6)))
+
+def _name(rng, index):
+    return f"{rng.choice(WORDS)}{rng.choice(WORDS)}{index}"
+
+def _body(rng, mean_chars):
+    length = _spread(rng, mean_chars)
+    statement = "var result = service.Execute(request); "
+    return (statement * (length // len(statement) + 1))[:length]
+
+
+class GraphWriter:
+    """Writes the {"nodes": [...], "edges": [...]} document incrementally."""
+
+    def __init__(self, f):
+        self._f = f
+        self._first = True
+        self.node_count = 0
+        self.edge_count = 0
+
+    def begin(self, key):
+        self._f.write(('{' if key == 'nodes' else '],\n') + json.dumps(key) + ': [\n')
+        self._first = True
+
+    def _write(self, record):
+        if not self._first:
+            self._f.write(',\n')
+        self._first = False
+        self._f.write(json.dumps(record, separators=(',', ':')))
+
+    def node(self, record):
+        self._write(record)
+        self.node_count += 1
+
+    def edge(self, source_id, target_id, edge_type, **properties):
+        self._write({'sourceId': source_id, 'targetId': target_id, 'type': edge_type, **properties})
+        self.edge_count += 1
+
+    def end(self):
+        self._f.write(']}\n')
+
+
+def generate_graph(f, namespaces=DEFAULT_NAMESPACES, classes=DEFAULT_CLASSES_PER_NAMESPACE,
+                   methods=DEFAULT_METHODS_PER_CLASS, calls_alpha=DEFAULT_CALLS_ALPHA,
+                   max_calls=DEFAULT_MAX_CALLS, max_inheritance_depth=DEFAULT_MAX_INHERITANCE_DEPTH,
+                   body_chars=DEFAULT_BODY_CHARS, duplicate_rate=DEFAULT_DUPLICATE_RATE, seed=42):
+    """Writes a synthetic solution graph to the open text file f; returns (node_count, edge_count).
+
+    Shape: namespaces CONTAIN types, classes CONTAIN methods, classes
+    INHERIT_FROM earlier classes (chains up to max_inheritance_depth) and
+    IMPLEMENT interfaces, and methods CALL other methods with a Pareto
+    distributed fan-out. Most calls stay in the caller's namespace; the rest
+    favour a small set of popular methods, like shared utilities do.
+    """
+    rng = random.Random(seed)
+    writer = GraphWriter(f)
+    writer.begin('nodes')
+    method_ids = []          # All method ids, for picking call targets
+    namespace_methods = []   # (first, end) range of each namespace in method_ids
+    class_ids, class_depths, interface_ids = [], [], []
+    contains, inherits, implements = [], [], []
+
+    for ns_index in tqdm(range(namespaces), desc="Generating Nodes", unit="namespace", file=sys.stdout):
+        ns_name = f"Contoso.{rng.choice(WORDS)}{ns_index}"
+        ns_id = f"N:{ns_name}"
+        writer.node({'id': ns_id, 'type': 'namespace', 'name': ns_name, 'fullName': ns_name})
+        first_method = len(method_ids)
+        for type_index in range(_spread(rng, classes)):
+            type_name = _name(rng, type_index)
+            full_name = f"{ns_name}.{type_name}"
+            file_path = f"src/{ns_name.replace('.', '/')}/{type_name}.cs"
+            type_id = f"T:{full_name}"
+            contains.append((ns_id, type_id))
+            if not interface_ids or rng.random() < DEFAULT_INTERFACE_RATIO:
+                writer.node({'id': type_id, 'type': 'interface', 'name': f"I{type_name}", 'fullName': full_name,
+                             'filePath': file_path, 'accessibility': 'public'})
+                interface_ids.append(type_id)
+                continue
+            node = {'id': type_id, 'type': 'class', 'name': type_name, 'fullName': full_name,
+                    'filePath': file_path, 'accessibility': rng.choice(ACCESSIBILITY),
+                    'isAbstract': rng.random() < 0.1, 'startLine': 1}
+            writer.node(node)
+            if rng.random() < duplicate_rate:
+                writer.node(dict(node, filePath=file_path.replace('.cs', '.Partial.cs'), isPartial=True))
+            depth = 0
+            if class_ids and rng.random() < DEFAULT_INHERIT_PROBABILITY:
+                base = rng.randrange(len(class_ids))
+                if class_depths[base] < max_inheritance_depth:
+                    inherits.append((type_id, class_ids[base]))
+                    depth = class_depths[base] + 1
+            class_ids.append(type_id)
+            class_depths.append(depth)
+            for _ in range(rng.choice((0, 0, 1, 1, 2))):
+                implements.append((type_id, rng.choice(interface_ids)))
+            line = 10
+            for method_index in range(_spread(rng, methods)):
+                method_name = f"{rng.choice(VERBS)}{rng.choice(WORDS)}{method_index}"
+                parameters = [rng.choice(PARAMETER_TYPES) for _ in range(rng.randrange(4))]
+                method_id = f"M:{full_name}.{method_name}({','.join(parameters)})"
+                body = _body(rng, body_chars)
+                end_line = line + 2 + len(body) // 60
+                writer.node({'id': method_id, 'type': 'method', 'name': method_name,
+                             'fullName': f"{full_name}.{method_name}", 'filePath': file_path,
+                             'startLine': line, 'endLine': end_line, 'accessibility': rng.choice(ACCESSIBILITY),
+                             'returnType': rng.choice(PARAMETER_TYPES + ("void", "void")),
+                             'parameters': parameters, 'source': body})
+                contains.append((type_id, method_id))
+                method_ids.append(method_id)
+                line = end_line + 2
+        namespace_methods.append((first_method, len(method_ids)))
+
+    writer.begin('edges')
+    for source_id, target_id in contains:
+        writer.edge(source_id, target_id, 'contains')
+    for source_id, target_id in inherits:
+        writer.edge(source_id, target_id, 'inherits_from')
+    for source_id, target_id in implements:
+        writer.edge(source_id, target_id, 'implements')
+    del contains, inherits, implements
+
+    total_methods = len(method_ids)
+    for ns_first, ns_end in tqdm(namespace_methods, desc="Generating Calls", unit="namespace", file=sys.stdout):
+        for caller in range(ns_first, ns_end):
+            fan_out = min(max_calls, int(rng.paretovariate(calls_alpha)) - 1)
+            for _ in range(fan_out):
+                if rng.random() < LOCAL_CALL_RATIO:
+                    callee = rng.randrange(ns_first, ns_end)
+                else:
+                    # Skewed towards low indices: a few popular methods receive most calls
+                    callee = int(total_methods * rng.random() ** 3)
+                writer.edge(method_ids[caller], method_ids[callee], 'calls', line=rng.randrange(1, 400))
+    writer.end()
+    return writer.node_count, writer.edge_count
+
+
+# --- Main Execution ---
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    print(f"Generating {args.namespaces} namespaces into {args.output_file}...", file=sys.stderr)
+    with open(args.output_file, 'w', encoding='utf-8') as out:
+        node_count, edge_count = generate_graph(
+            out, namespaces=args.namespaces, classes=args.classes, methods=args.methods,
+            calls_alpha=args.calls_alpha, max_calls=args.max_calls,
+            max_inheritance_depth=args.max_inheritance_depth, body_chars=args.body_chars,
+            duplicate_rate=args.duplicate_rate, seed=args.seed)
+    print(f"Wrote {node_count} nodes and {edge_count} edges.", file=sys.stderr)
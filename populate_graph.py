@@ -2,12 +2,99 @@ import json
 import os
 import time
 import argparse
+import asyncio
+import contextlib
+import csv
+import hashlib
+import math
+import re
+import shlex
+import sqlite3
 import sys
-from neo4j import GraphDatabase, basic_auth
+import queue
+import random
+import threading
+import zlib
+import concurrent.futures
+import glob
+import gzip
+import io
+import lzma
+import multiprocessing
+from array import array
+from collections import Counter, deque
+from itertools import islice
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import simdjson
+except ImportError:
+    simdjson = None
+from neo4j import AsyncGraphDatabase, GraphDatabase, basic_auth
+from neo4j.exceptions import (
+    Neo4jError, ServiceUnavailable, SessionExpired, TransientError,
+)
 from tqdm import tqdm # Import tqdm
 
 # Default batch size for processing nodes/edges
 DEFAULT_DB_BATCH_SIZE = 1000
+# Number of characters read from the input file per chunk in streaming mode
+STREAM_CHUNK_SIZE = 1 << 20
+# A JSON value cut off by the end of the stream buffer fails (or ends) within this
+# many characters of it (longest literal, escape or number suffix); errors further
+# back are syntax errors
+STREAM_TOKEN_TAIL = 16
+# Compressed inputs are recognized by their leading magic bytes
+COMPRESSION_MAGIC = {b"\x1f\x8b": "gzip", b"\xfd7zXZ\x00": "xz", b"\x28\xb5\x2f\xfd": "zstd"}
+COMPRESSION_SUFFIXES = (".gz", ".xz", ".zst")
+# Inputs with these endings (before any compression suffix) hold one JSON record per line
+NDJSON_SUFFIXES = (".ndjson", ".jsonl")
+# Fast JSON decoders, in order of preference when --json-decoder is auto
+FAST_JSON_DECODERS = ("orjson", "simdjson")
+# File name endings picked up when a directory of shards is given as input
+INPUT_SUFFIXES = tuple(base + compression for base in (".json",) + NDJSON_SUFFIXES
+                       for compression in ("",) + COMPRESSION_SUFFIXES)
+# Label given to nodes whose 'type' is missing or empty
+UNTYPED_NODE_LABEL = "Untyped"
+# Relationship type used for edges whose 'type' is missing or empty
+UNTYPED_REL_TYPE = "RELATED_TO"
+# Shared label carried by every imported node, backed by its own unique id index
+LOOKUP_LABEL = "CodeElement"
+# Seconds to wait for index population before inserts begin
+DEFAULT_INDEX_TIMEOUT = 300
+# Adaptive batching: commit latency to steer toward, payload cap and row bounds
+DEFAULT_TARGET_LATENCY = 1.0
+DEFAULT_MAX_BATCH_BYTES = 8 * 1024 * 1024
+MIN_ADAPTIVE_BATCH_ROWS = 10
+MAX_ADAPTIVE_BATCH_ROWS = 50000
+# Rows deleted per inner transaction when clearing the database
+DEFAULT_CLEAR_BATCH_SIZE = 10000
+# Inner transactions per clear query; progress is reported between queries
+CLEAR_TRANSACTIONS_PER_QUERY = 10
+# Concurrent in-flight transactions in --async mode
+DEFAULT_MAX_INFLIGHT = 8
+# Retries for transient failures (deadlocks, leader switches, lost connections)
+DEFAULT_MAX_RETRIES = 5
+RETRY_BASE_DELAY = 0.2
+RETRY_MAX_DELAY = 10.0
+# Errors that are safe to retry: the transaction was rolled back and can be replayed
+RETRYABLE_ERRORS = (TransientError, ServiceUnavailable, SessionExpired)
+# Server error codes caused by the records in a batch rather than by the query, the
+# database or the transaction; only these are bisected to isolate the offending records
+DATA_ERROR_CODES = (
+    "Neo.ClientError.Schema.ConstraintValidationFailed",
+    "Neo.ClientError.Statement.TypeError",
+    "Neo.ClientError.Statement.ArgumentError",
+)
+# Graph analytics: relationship types analysed by default and PageRank parameters
+DEFAULT_ANALYTICS_EDGE_TYPES = "CALLS"
+PAGERANK_DAMPING = 0.85
+PAGERANK_MAX_ITERATIONS = 100
+PAGERANK_TOLERANCE = 1e-6
+# Records the server may reject (after bisecting) before the import is aborted
+DEFAULT_MAX_REJECTS = 100
 
 # --- Configuration & Argument Parsing ---
 
@@ -15,8 +102,11 @@ def parse_arguments():
     """Parses command-line arguments."""
     parser = argparse.ArgumentParser(description="Populate Neo4j database from Roslyn code analysis JSON.")
     parser.add_argument(
-        "input_file",
-        help="Path to the input JSON file (e.g., code_structure.json)."
+        "inputs",
+        nargs="+",
+        metavar="input_file",
+        help="Path to the input JSON file (e.g., code_structure.json). Several files, directories "
+             "and glob patterns (e.g. 'out/*.json') are imported together as shards of one graph."
     )
     # ... (other arguments: --uri, --user, --password, --clear, --database remain the same) ...
     parser.add_argument(
@@ -39,6 +129,18 @@ def parse_arguments():
         action="store_true",
         help="Clear the existing graph database before importing."
     )
+    parser.add_argument(
+        "--clear-batch-size",
+        type=int,
+        default=DEFAULT_CLEAR_BATCH_SIZE,
+        help=f"Rows deleted per transaction by --clear (default: {DEFAULT_CLEAR_BATCH_SIZE})."
+    )
+    parser.add_argument(
+        "--recreate-database",
+        action="store_true",
+        help="Clear by dropping and recreating the database instead of deleting in batches "
+             "(requires admin rights and a Neo4j edition that supports multiple databases)."
+    )
     parser.add_argument(
         "--database", "-db",
         default="neo4j",
@@ -50,174 +152,3439 @@ def parse_arguments():
         default=DEFAULT_DB_BATCH_SIZE,
         help=f"Batch size for Neo4j operations (default: {DEFAULT_DB_BATCH_SIZE})."
     )
+    parser.add_argument(
+        "--sink",
+        choices=sorted(SINKS),
+        default="neo4j",
+        help="Where to write: 'neo4j' (default), 'memory' (an in-process reference graph) or "
+             "'null' (discard everything), the latter two for profiling the client without a server."
+    )
+    parser.add_argument(
+        "--workers", "-w",
+        type=int,
+        default=1,
+        help="Number of concurrent sessions used to write nodes and edges (default: 1)."
+    )
+    parser.add_argument(
+        "--async",
+        dest="use_async",
+        action="store_true",
+        help="Write batches with the asyncio driver, overlapping parsing and "
+             "parameter building with in-flight transactions."
+    )
+    parser.add_argument(
+        "--max-inflight",
+        type=int,
+        default=DEFAULT_MAX_INFLIGHT,
+        help=f"Maximum concurrent transactions in --async mode (default: {DEFAULT_MAX_INFLIGHT})."
+    )
+    parser.add_argument(
+        "--max-retries",
+        type=int,
+        default=DEFAULT_MAX_RETRIES,
+        help=f"Retries per batch for deadlocks and other transient errors (default: {DEFAULT_MAX_RETRIES})."
+    )
+    parser.add_argument(
+        "--rejects",
+        metavar="FILE",
+        default=None,
+        help="JSON Lines file receiving records the server rejected (default: '<input_file>.rejects.jsonl')."
+    )
+    parser.add_argument(
+        "--max-rejects",
+        type=int,
+        default=DEFAULT_MAX_REJECTS,
+        help=f"Abort once more than this many records were rejected (default: {DEFAULT_MAX_REJECTS})."
+    )
+    parser.add_argument(
+        "--no-element-ids",
+        action="store_true",
+        help="Do not cache the elementId of written nodes; match edge endpoints by label and id instead."
+    )
+    parser.add_argument(
+        "--labels",
+        default=None,
+        help="Comma-separated node labels to create constraints for. "
+             "By default they are discovered from the node types in the input."
+    )
+    parser.add_argument(
+        "--index-timeout",
+        type=int,
+        default=DEFAULT_INDEX_TIMEOUT,
+        help=f"Seconds to wait for indexes to come online before importing (default: {DEFAULT_INDEX_TIMEOUT})."
+    )
+    parser.add_argument(
+        "--checkpoint",
+        metavar="FILE",
+        default=None,
+        help="Record committed batches in this checkpoint file, so a failed import can be continued "
+             "with --resume (default with --resume: '<input_file>.checkpoint.json'; removed after a "
+             "successful import)."
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Record progress in the checkpoint file and skip the nodes and edges already committed "
+             "according to it."
+    )
+    parser.add_argument(
+        "--incremental",
+        metavar="SNAPSHOT",
+        default=None,
+        help="Only write nodes and edges that changed since the import recorded in the SNAPSHOT "
+             "file (created on first use, updated after every successful import)."
+    )
+    parser.add_argument(
+        "--export-csv",
+        metavar="DIR",
+        default=None,
+        help="Do not connect to Neo4j; instead write neo4j-admin import CSV files "
+             "(one header and one data file per node label and relationship type) to DIR."
+    )
+    parser.add_argument(
+        "--adaptive-batching",
+        action="store_true",
+        help="Size batches by estimated payload bytes and adjust the row count toward "
+             "--target-latency, starting from --db-batch-size."
+    )
+    parser.add_argument(
+        "--target-latency",
+        type=float,
+        default=DEFAULT_TARGET_LATENCY,
+        help=f"Commit latency in seconds that adaptive batching aims for (default: {DEFAULT_TARGET_LATENCY})."
+    )
+    parser.add_argument(
+        "--max-batch-bytes",
+        type=int,
+        default=DEFAULT_MAX_BATCH_BYTES,
+        help=f"Estimated payload size at which an adaptive batch is closed (default: {DEFAULT_MAX_BATCH_BYTES})."
+    )
+    parser.add_argument(
+        "--skip-validation",
+        action="store_true",
+        help="Do not check the input for duplicate node ids, dangling edges and duplicate edges, "
+             "and write it unchanged. In --stream mode this saves a full pass over the input before "
+             "the first write and the id/edge hash sets (about 70 bytes per node and per edge)."
+    )
+    parser.add_argument(
+        "--edge-counts",
+        action="store_true",
+        help="Store how many duplicate edges were collapsed into a relationship in its 'count' property."
+    )
+    parser.add_argument(
+        "--analytics",
+        action="store_true",
+        help="Before writing, compute fanIn, fanOut, pageRank, strongly connected components "
+             "(sccId, sccSize, recursive) and topoLayer over the --analytics-edge-types relationships "
+             "and store them as node properties."
+    )
+    parser.add_argument(
+        "--analytics-edge-types",
+        default=DEFAULT_ANALYTICS_EDGE_TYPES,
+        help="Comma-separated relationship types forming the analysed graph, or '*' for all "
+             f"(default: {DEFAULT_ANALYTICS_EDGE_TYPES})."
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Run the first batch of every node and edge query shape under PROFILE, save the plans "
+             "(rows and db hits per operator) to --profile-output and warn about label or full "
+             "scans, which point to missing indexes."
+    )
+    parser.add_argument(
+        "--profile-output",
+        metavar="FILE",
+        help="Where --profile saves the query plans (default: <input_file>.plans.json). Implies --profile."
+    )
+    parser.add_argument(
+        "--metrics-json",
+        metavar="FILE",
+        help="Write a JSON report with per-stage timings and per-phase throughput, batch latency "
+             "percentiles, retries and rejects (also written when the import fails)."
+    )
+    parser.add_argument(
+        "--metrics-prom",
+        metavar="FILE",
+        help="Write the same metrics in Prometheus text format, e.g. for the node_exporter textfile collector."
+    )
+    parser.add_argument(
+        "--parse-processes",
+        type=int,
+        default=min(os.cpu_count() or 1, 8),
+        help="Processes parsing shards in parallel when several input files are given "
+             "(default: the number of CPUs, at most 8; 1 parses in this process)."
+    )
+    parser.add_argument(
+        "--json-decoder",
+        choices=("auto", "orjson", "simdjson", "json"),
+        default="auto",
+        help="JSON decoder for whole documents and NDJSON lines: 'auto' (default) uses orjson or "
+             "simdjson when installed and the standard library otherwise."
+    )
+    parser.add_argument(
+        "--compact",
+        action="store_true",
+        help="Hold the parsed graph in a columnar store (ids and types interned to integer codes, "
+             "properties in per-key columns) instead of lists of dicts, to cut memory on large inputs."
+    )
+    parser.add_argument(
+        "--stream", "-s",
+        action="store_true",
+        help="Parse the input incrementally and write batches as they are read, "
+             "instead of loading the whole JSON file into memory first. Unless --skip-validation is "
+             "given, the input is still validated in an extra pass before the first write."
+    )
+
+
+    args = parser.parse_args()
+    try:
+        args.input_files = expand_inputs(args.inputs)
+    except FileNotFoundError as e:
+        parser.error(str(e))
+    # Base name for the default checkpoint, rejects and plans files
+    if len(args.inputs) == 1 and not glob.has_magic(args.inputs[0]):
+        args.input_file = args.inputs[0].rstrip("/" + os.sep) or args.inputs[0]
+    else:
+        args.input_file = os.path.join(os.path.commonpath([os.path.dirname(os.path.abspath(path))
+                                                           for path in args.input_files]), "shards")
+    try:
+        args.json_decoder = resolve_json_decoder(args.json_decoder)
+    except ImportError as e:
+        parser.error(str(e))
+    if args.analytics_edge_types.strip() == "*":
+        args.analytics_edge_types = None
+    else:
+        args.analytics_edge_types = {rel_type(name.strip()) for name in args.analytics_edge_types.split(",")
+                                     if name.strip()}
+    if args.compact and args.stream:
+        parser.error("--compact and --stream are mutually exclusive.")
+    if args.parse_processes < 1:
+        parser.error("--parse-processes must be at least 1.")
+    if args.workers < 1:
+        parser.error("--workers must be at least 1.")
+    if args.max_inflight < 1:
+        parser.error("--max-inflight must be at least 1.")
+    if args.use_async and args.workers > 1:
+        parser.error("--async and --workers are mutually exclusive.")
+    if args.use_async and args.sink != "neo4j":
+        parser.error("--async only works with --sink neo4j.")
+    if args.profile_output is not None:
+        args.profile = True
+    if args.profile and (args.use_async or args.sink != "neo4j"):
+        parser.error("--profile needs --sink neo4j and cannot be combined with --async.")
+    # From here on args.profile is the plans file, or None when not profiling
+    args.profile = (args.profile_output or args.input_file + ".plans.json") if args.profile else None
+    if args.resume and args.incremental:
+        parser.error("--resume cannot be combined with --incremental.")
+    # Checkpoints are opt-in, so plain imports never write next to the input
+    args.use_checkpoint = args.resume or args.checkpoint is not None
+    if args.checkpoint is None:
+        # Incremental runs always keep one, next to the snapshot they are diffed against
+        args.checkpoint = (args.incremental if args.incremental else args.input_file) + ".checkpoint.json"
+    if args.rejects is None:
+        args.rejects = args.input_file + ".rejects.jsonl"
+    if not args.password and not args.export_csv and args.sink == "neo4j":
+        print("Warning: Neo4j password not provided via --password or NEO4J_PASSWORD env var.", file=sys.stderr)
+    return args
+
+# --- Input Loading ---
+
+class JsonStreamReader:
+    """Incremental reader over a JSON document, decoding one value at a time.
+
+    Only the structure around the values of interest (the top-level object and
+    its arrays) is walked by hand; each array element is decoded with the stdlib
+    decoder, so memory stays bounded by the largest single element.
+    """
+
+    def __init__(self, f, chunk_size=STREAM_CHUNK_SIZE):
+        self._f = f
+        self._chunk_size = chunk_size
+        self._buf = ""
+        self._pos = 0
+        self._offset = 0  # Characters of the input dropped before the buffer
+        self._eof = False
+        self._decoder = json.JSONDecoder()
+
+    def _fill(self, min_size=0):
+        """Reads another chunk, dropping the already consumed part of the buffer."""
+        if self._eof:
+            return False
+        chunk = self._f.read(max(self._chunk_size, min_size))
+        if not chunk:
+            self._eof = True
+            return False
+        self._offset += self._pos
+        self._buf = self._buf[self._pos:] + chunk
+        self._pos = 0
+        return True
+
+    def peek(self):
+        """Returns the next non-whitespace character without consuming it ('' at EOF)."""
+        while True:
+            buf, pos = self._buf, self._pos
+            while pos < len(buf) and buf[pos] in " \t\r\n":
+                pos += 1
+            self._pos = pos
+            if pos < len(buf):
+                return buf[pos]
+            if not self._fill():
+                return ""
+
+    def expect(self, char):
+        found = self.peek()
+        if found != char:
+            raise ValueError(f"Malformed JSON input: expected '{char}', found '{found or 'EOF'}'.")
+        self._pos += 1
+
+    def value(self):
+        """Decodes and returns the next complete JSON value."""
+        self.peek()
+        while True:
+            try:
+                obj, end = self._decoder.raw_decode(self._buf, self._pos)
+            except json.JSONDecodeError as e:
+                # A value cut off by the end of the buffer is grown and retried; anything
+                # else is a syntax error, raised without reading the rest of the input
+                cut_off = e.msg.startswith("Unterminated string") or e.pos >= len(self._buf) - STREAM_TOKEN_TAIL
+                if not (cut_off and self._fill(len(self._buf) - self._pos)):
+                    raise ValueError(f"Malformed JSON input at character {self._offset + e.pos}: {e.msg}.") from None
+                continue
+            # A number (or any value) ending near the buffer end may continue in the next chunk
+            if end >= len(self._buf) - STREAM_TOKEN_TAIL and self._fill(len(self._buf) - self._pos):
+                continue
+            self._pos = end
+            return obj
+
+    def iter_array(self):
+        """Yields the elements of the array starting at the current position."""
+        self.expect("[")
+        if self.peek() == "]":
+            self._pos += 1
+            return
+        while True:
+            yield self.value()
+            if self.peek() == ",":
+                self._pos += 1
+            else:
+                self.expect("]")
+                return
+
+    def skip_value(self):
+        """Skips the next value, walking arrays element by element to bound memory."""
+        if self.peek() == "[":
+            for _ in self.iter_array():
+                pass
+        else:
+            self.value()
+
+    def iter_top_level_array(self, key):
+        """Yields the elements of the array stored under `key` in the top-level object."""
+        self.expect("{")
+        if self.peek() == "}":
+            return
+        while True:
+            name = self.value()
+            self.expect(":")
+            if name == key and self.peek() == "[":
+                yield from self.iter_array()
+                return  # Nothing after the wanted array is needed
+            self.skip_value()
+            if self.peek() == ",":
+                self._pos += 1
+            else:
+                self.expect("}")
+                return
+
+
+def resolve_json_decoder(name="auto"):
+    """Returns the decoder name to use: the first installed fast decoder for 'auto'."""
+    installed = {"orjson": orjson is not None, "simdjson": simdjson is not None, "json": True}
+    if name == "auto":
+        return next((fast for fast in FAST_JSON_DECODERS if installed[fast]), "json")
+    if not installed.get(name):
+        package = "pysimdjson" if name == "simdjson" else name
+        raise ImportError(f"JSON decoder '{name}' is not installed (pip install {package}).")
+    return name
+
+def effective_json_decoder(paths, decoder, compact=False):
+    """Returns the name of the decoder that actually parses the input, for reports.
+
+    --compact walks JSON documents with JsonStreamReader (stdlib), so only its
+    NDJSON shards use the selected decoder; mixed inputs report both.
+    """
+    if not compact:
+        return decoder
+    return "+".join(sorted({decoder if is_ndjson(path) else "json" for path in paths}))
+
+def json_loads(decoder="json"):
+    """Returns a loads(str or bytes) function for the named decoder.
+
+    Fast decoders are stricter than the stdlib one (no NaN, no integers beyond
+    64 bits), so a document they refuse is decoded again with json.loads; real
+    syntax errors still raise from there.
+    """
+    if decoder == "json":
+        return json.loads
+    fast_loads = orjson.loads if decoder == "orjson" else simdjson.loads
+
+    def loads(data):
+        try:
+            return fast_loads(data)
+        except ValueError:
+            return json.loads(data)
+    return loads
+
+def open_input(path, binary=False):
+    """Opens an input file for reading text (or bytes), decompressing gzip, xz or zstd data on the fly."""
+    with open(path, 'rb') as f:
+        head = f.read(6)
+    compression = next((name for magic, name in COMPRESSION_MAGIC.items() if head.startswith(magic)), None)
+    if compression == "gzip":
+        return gzip.open(path, 'rb') if binary else gzip.open(path, 'rt', encoding='utf-8')
+    if compression == "xz":
+        return lzma.open(path, 'rb') if binary else lzma.open(path, 'rt', encoding='utf-8')
+    if compression == "zstd":
+        try:
+            import zstandard
+        except ImportError:
+            raise ImportError(f"Reading zstd-compressed input ({path}) needs the 'zstandard' package.") from None
+        raw = open(path, 'rb')
+        reader = io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(raw, closefd=True))
+        return reader if binary else io.TextIOWrapper(reader, encoding='utf-8')
+    return open(path, 'rb') if binary else open(path, 'r', encoding='utf-8')
+
+def is_ndjson(path):
+    """True when the file name marks newline-delimited JSON (optionally compressed)."""
+    name = path.lower()
+    for suffix in COMPRESSION_SUFFIXES:
+        if name.endswith(suffix):
+            name = name[:-len(suffix)]
+            break
+    return name.endswith(NDJSON_SUFFIXES)
+
+def is_edge_record(record):
+    """NDJSON lines are edges when they carry both endpoints, and nodes otherwise."""
+    return 'sourceId' in record and 'targetId' in record
+
+def iter_ndjson(path, decoder="json"):
+    """Lazily yields the records of a newline-delimited JSON file; blank lines are skipped."""
+    loads = json_loads(decoder)
+    with open_input(path, binary=True) as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                record = loads(line)
+            except ValueError as e:
+                raise ValueError(f"Malformed JSON on line {line_number} of {path}: {e}") from None
+            if not isinstance(record, dict):
+                raise ValueError(f"Line {line_number} of {path} is not a JSON object.")
+            yield record
+
+def iter_json_array(path, key, decoder="json"):
+    """Lazily yields the records of the top-level `key` array of a JSON file, or the
+    node or edge lines of an NDJSON file.
+
+    The decoder is used for NDJSON lines; JSON documents are walked by
+    JsonStreamReader, which needs the stdlib's incremental raw_decode.
+    """
+    if is_ndjson(path):
+        want_edges = key == 'edges'
+        for record in iter_ndjson(path, decoder):
+            if is_edge_record(record) == want_edges:
+                yield record
+        return
+    with open_input(path) as f:
+        yield from JsonStreamReader(f).iter_top_level_array(key)
+
+
+class JsonArrayStream:
+    """Re-iterable view of one top-level array; every iteration re-reads the file."""
+
+    def __init__(self, path, key, decoder="json"):
+        self.path = path
+        self.key = key
+        self.decoder = decoder
+
+    def __iter__(self):
+        return iter_json_array(self.path, self.key, self.decoder)
+
+
+def expand_inputs(inputs):
+    """Resolves input arguments (files, directories and glob patterns) to a sorted list of shard files.
+
+    Directories contribute the files directly inside them whose name ends in
+    one of INPUT_SUFFIXES. The order is deterministic, so checkpoints and
+    duplicate merging see the shards in the same order on every run.
+    """
+    paths = []
+    for pattern in inputs:
+        if os.path.isdir(pattern):
+            found = sorted(os.path.join(pattern, name) for name in os.listdir(pattern)
+                           if name.endswith(INPUT_SUFFIXES) and os.path.isfile(os.path.join(pattern, name)))
+        elif glob.has_magic(pattern):
+            found = sorted(path for path in glob.glob(pattern, recursive=True) if os.path.isfile(path))
+        elif os.path.isfile(pattern):
+            found = [pattern]
+        else:
+            raise FileNotFoundError(f"Input file not found: {pattern}")
+        if not found:
+            raise FileNotFoundError(f"No input files match: {pattern}")
+        paths.extend(found)
+    # A shard named twice (e.g. by a directory and a glob) is read once
+    return list(dict.fromkeys(paths))
+
+def _read_shard(path, decoder="json"):
+    """Process pool task: parses one whole shard and returns its (nodes, edges) lists."""
+    if is_ndjson(path):
+        nodes, edges = [], []
+        for record in iter_ndjson(path, decoder):
+            (edges if is_edge_record(record) else nodes).append(record)
+        return nodes, edges
+    with open_input(path, binary=True) as f:
+        analysis_data = json_loads(decoder)(f.read())
+    return analysis_data.get('nodes', []), analysis_data.get('edges', [])
+
+def _read_shard_array(path, key, decoder="json"):
+    """Process pool task: returns the `key` array of one shard, read with the streaming parser."""
+    return list(iter_json_array(path, key, decoder))
+
+def map_shards(task, paths, processes, *args):
+    """Yields task(path, *args) for every shard in order, running up to `processes` tasks at once.
+
+    Only `processes` results are pending at any time, so a consumer that falls
+    behind (e.g. a writer waiting on the server) bounds memory to a few shards.
+    Workers are spawned rather than forked because writer threads may be running.
+    """
+    if processes <= 1 or len(paths) <= 1:
+        for path in paths:
+            yield task(path, *args)
+        return
+    context = multiprocessing.get_context("spawn")
+    with concurrent.futures.ProcessPoolExecutor(max_workers=processes, mp_context=context) as pool:
+        remaining = iter(paths)
+        pending = deque(pool.submit(task, path, *args) for path in islice(remaining, processes))
+        while pending:
+            result = pending.popleft().result()
+            for path in islice(remaining, 1):
+                pending.append(pool.submit(task, path, *args))
+            yield result
+
+
+class ShardedArrayStream:
+    """Re-iterable view of one top-level array across several shard files, in shard order.
+
+    Every iteration re-reads the shards, parsing up to `processes` of them in
+    parallel worker processes; only those shards are held in memory at once.
+    """
+
+    def __init__(self, paths, key, processes=1, decoder="json"):
+        self.paths = paths
+        self.key = key
+        self.processes = processes
+        self.decoder = decoder
+
+    def __iter__(self):
+        for records in map_shards(_read_shard_array, self.paths, self.processes, self.key, self.decoder):
+            yield from records
+
+
+def load_graph(paths, stream=False, processes=1, compact=False, decoder="json"):
+    """Returns (nodes, edges) from the analyzer output, a single file or a list of shard files.
+
+    With stream=False both are fully materialized lists. With stream=True they are
+    JsonArrayStream (or ShardedArrayStream) objects; each iteration re-opens the
+    files, so nodes can be written completely before edge parsing starts and
+    extra passes (such as label discovery) stay memory-bounded. With
+    compact=True they are the CompactRecords of a CompactGraph. `decoder`
+    names the JSON decoder (see json_loads) used wherever whole documents or
+    NDJSON lines are decoded.
+
+    Shards are concatenated in order. A node id appearing in several shards is
+    merged by the validation pass, and edges may reference nodes of any shard:
+    all nodes are written before the first edge.
+    """
+    if isinstance(paths, str):
+        paths = [paths]
+    if stream:
+        for path in paths:
+            if not os.path.isfile(path):
+                raise FileNotFoundError(f"Input file not found: {path}")
+        if len(paths) == 1:
+            return JsonArrayStream(paths[0], 'nodes', decoder), JsonArrayStream(paths[0], 'edges', decoder)
+        return (ShardedArrayStream(paths, 'nodes', processes, decoder),
+                ShardedArrayStream(paths, 'edges', processes, decoder))
+    if compact:
+        nodes, edges = load_compact_graph(paths, processes, decoder)
+    else:
+        nodes, edges = [], []
+        shards = map_shards(_read_shard, paths, processes, decoder)
+        if len(paths) > 1:
+            shards = tqdm(shards, total=len(paths), desc="Parsing Shards", unit="file", file=sys.stdout)
+        for shard_nodes, shard_edges in shards:
+            nodes.extend(shard_nodes)
+            edges.extend(shard_edges)
+    if not nodes:
+        print("Warning: No nodes found in input file.", file=sys.stderr)
+    if not edges:
+        print("Warning: No edges found in input file.", file=sys.stderr)
+    return nodes, edges
+
+
+def batched(records, batch_size):
+    """Yields lists of up to batch_size records from any iterable."""
+    it = iter(records)
+    while True:
+        batch = list(islice(it, batch_size))
+        if not batch:
+            return
+        yield batch
+
+# --- Compact Graph Store ---
+
+# Marks an absent value in an int64 property column
+INT64_MISSING = -(1 << 63)
+_MISSING = object()
+
+
+class ValueInterner:
+    """Maps hashable values (ids, type names) to dense integer codes and back."""
+
+    def __init__(self):
+        self.codes = {}
+        self.values = []
+
+    def code(self, value):
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+    def __len__(self):
+        return len(self.values)
+
+
+class PropertyColumn:
+    """All values of one property key, by row.
+
+    Stays an int64 array while every value is a plain int and falls back to a
+    list otherwise. Rows are padded only when a later row sets the key, so
+    sparse properties cost nothing for the rows that lack them.
+    """
+
+    def __init__(self):
+        self.values = array('q')
+
+    def _pad(self, row):
+        if len(self.values) < row:
+            missing = INT64_MISSING if isinstance(self.values, array) else _MISSING
+            self.values.extend([missing] * (row - len(self.values)))
+
+    def set(self, row, value):
+        if isinstance(self.values, array):
+            if type(value) is int and INT64_MISSING < value < (1 << 63):
+                self._pad(row)
+                self.values.append(value)
+                return
+            self.values = [_MISSING if v == INT64_MISSING else v for v in self.values]
+        self._pad(row)
+        self.values.append(value)
+
+    def get(self, row):
+        if row >= len(self.values):
+            return _MISSING
+        value = self.values[row]
+        if isinstance(self.values, array):
+            return _MISSING if value == INT64_MISSING else value
+        return value
+
+
+class CompactRecords:
+    """Column store of node or edge records, re-iterable as dicts like JsonArrayStream.
+
+    Coded fields (ids, endpoints, types) are interned to integer codes kept in
+    parallel arrays, -1 meaning the key was absent. Every other key gets its
+    own PropertyColumn. Iterating rebuilds one dict at a time, so the whole
+    pipeline works unchanged while only the columns stay resident.
+    """
+
+    def __init__(self, coded_fields):
+        self.coded_fields = coded_fields  # (key, interner) pairs
+        self.codes = {key: array('q') for key, _ in coded_fields}
+        self.columns = {}
+        self.row_count = 0
+
+    def append(self, record):
+        row = self.row_count
+        extra = dict(record)
+        for key, interner in self.coded_fields:
+            code = -1
+            if key in extra:
+                try:
+                    code = interner.code(extra[key])
+                    del extra[key]
+                except TypeError:
+                    pass  # Unhashable value; kept in a property column instead
+            self.codes[key].append(code)
+        for key, value in extra.items():
+            column = self.columns.get(key)
+            if column is None:
+                column = self.columns[key] = PropertyColumn()
+            column.set(row, value)
+        self.row_count += 1
+
+    def extend(self, records):
+        for record in records:
+            self.append(record)
+
+    def record(self, row):
+        record = {}
+        for key, interner in self.coded_fields:
+            code = self.codes[key][row]
+            if code >= 0:
+                record[key] = interner.values[code]
+        for key, column in self.columns.items():
+            value = column.get(row)
+            if value is not _MISSING:
+                record[key] = value
+        return record
+
+    def __len__(self):
+        return self.row_count
+
+    def __iter__(self):
+        for row in range(self.row_count):
+            yield self.record(row)
+
+
+class CompactGraph:
+    """Nodes and edges in column stores sharing one id interner.
+
+    Edge endpoints are codes into the same table as node ids, so the edge
+    arrays (sourceId, targetId, type) are plain integer columns.
+    """
+
+    def __init__(self):
+        self.ids = ValueInterner()
+        self.node_types = ValueInterner()
+        self.edge_types = ValueInterner()
+        self.nodes = CompactRecords((('id', self.ids), ('type', self.node_types)))
+        self.edges = CompactRecords((('sourceId', self.ids), ('targetId', self.ids), ('type', self.edge_types)))
+
+
+def load_compact_graph(paths, processes=1, decoder="json"):
+    """Reads the input into a CompactGraph, converting records as they are parsed.
+
+    Single inputs are read with the streaming parser, so no list of dicts is
+    ever built; with several shards and processes > 1 each shard is parsed in
+    a worker and converted as it arrives.
+    """
+    graph = CompactGraph()
+    for key, table in (('nodes', graph.nodes), ('edges', graph.edges)):
+        if processes <= 1 or len(paths) <= 1:
+            shards = (iter_json_array(path, key, decoder) for path in paths)
+        else:
+            shards = map_shards(_read_shard_array, paths, processes, key, decoder)
+        for records in shards:
+            table.extend(records)
+    print(f"Compact store holds {len(graph.nodes)} nodes and {len(graph.edges)} edges "
+          f"({len(graph.ids)} distinct ids, {len(graph.node_types)} node types, "
+          f"{len(graph.edge_types)} edge types).", file=sys.stderr)
+    return graph.nodes, graph.edges
+
+# --- Cypher Helpers ---
+
+def node_label(node_type):
+    """Returns the Neo4j label for a node type (first letter upper-cased, like apoc.text.capitalize)."""
+    node_type = str(node_type or "")
+    if not node_type:
+        return UNTYPED_NODE_LABEL
+    return node_type[:1].upper() + node_type[1:]
+
+def quote_name(name):
+    """Backtick-quotes a label or relationship type for safe use in static Cypher."""
+    return "`" + name.replace("`", "``") + "`"
+
+def rel_type(edge_type):
+    """Returns the Neo4j relationship type for an edge type (upper-cased, like apoc.text.toUpperCase)."""
+    edge_type = str(edge_type or "")
+    return edge_type.upper() if edge_type else UNTYPED_REL_TYPE
+
+# Edge keys that define the relationship itself; every other key is a property
+EDGE_KEYS = ('sourceId', 'targetId', 'type')
+
+def edge_properties(edge):
+    """Returns the properties of an edge record (everything except its endpoints and type)."""
+    return {key: value for key, value in edge.items() if key not in EDGE_KEYS}
+
+def stored_edge_properties(edge):
+    """Returns the properties a relationship ends up with (SET r = map drops null values)."""
+    return {key: value for key, value in edge.items() if key not in EDGE_KEYS and value is not None}
+
+def group_by_label(batch):
+    """Splits a batch of node records into {label: [records]} preserving input order."""
+    groups = {}
+    for node in batch:
+        groups.setdefault(node_label(node.get('type')), []).append(node)
+    return groups
+
+# --- Validation & Deduplication ---
+
+# Canonical JSON (sorted keys, no whitespace); the encoder is built once, unlike json.dumps(**options)
+_canonical_json = json.JSONEncoder(sort_keys=True, separators=(',', ':'), ensure_ascii=False).encode
+
+def _hash64(value):
+    """Returns a 64-bit hash of a JSON-serializable value, as a compact int.
+
+    String and integer ids are hashed directly (an integer's JSON is its
+    str()); other values through their canonical JSON. The 'str'
+    personalization keeps a string apart from the JSON text it spells.
+    """
+    if type(value) is str:
+        digest = hashlib.blake2b(value.encode('utf-8'), digest_size=8, person=b'str').digest()
+    else:
+        canonical = str(value) if type(value) is int else _canonical_json(value)
+        digest = hashlib.blake2b(canonical.encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big')
+
+def _edge_hash(source_hash, target_hash, edge):
+    """edge_key from the already computed hashes of the edge's endpoints."""
+    key = f"{source_hash:x} {target_hash:x} {rel_type(edge.get('type'))}"
+    properties = edge_properties(edge)
+    if properties:
+        key += " " + _canonical_json(properties)
+    return int.from_bytes(hashlib.blake2b(key.encode('utf-8'), digest_size=8, person=b'edge').digest(), 'big')
+
+def edge_key(edge):
+    """Returns a 64-bit hash of an edge's endpoints, type and properties.
+
+    Edges that only differ in their properties (e.g. calls from different
+    lines) are distinct relationships, not duplicates.
+    """
+    return _edge_hash(_hash64(edge.get('sourceId')), _hash64(edge.get('targetId')), edge)
+
+def merge_node_records(merged, node):
+    """Folds a duplicate node record into merged; later non-null values win."""
+    merged.update((key, value) for key, value in node.items() if value is not None)
+    return merged
+
+
+class FilteredRecords:
+    """Re-iterable filtered view of a record stream; the filter restarts on every pass."""
+
+    def __init__(self, records, make_filter):
+        self.records = records
+        self.make_filter = make_filter
+
+    def __iter__(self):
+        return self.make_filter(self.records)
+
+
+def _filtered(records, make_filter):
+    """Applies make_filter eagerly to lists and lazily (re-iterably) to streams."""
+    if isinstance(records, list):
+        return list(make_filter(records))
+    return FilteredRecords(records, make_filter)
+
+def _by_type(counter):
+    return ", ".join(f"{name}: {count}" for name, count in counter.most_common())
+
+
+class GraphValidation:
+    """Outcome of validate_graph: problem counts by type, and filters that fix them.
+
+    Node ids and edge keys are kept as 64-bit hashes, so memory grows by a
+    small int per record rather than by the records themselves; only the
+    records of duplicated node ids are held, and only until their last copy
+    has been read. Duplicate node records are merged into one (emitted where
+    the last copy was), duplicate edges are collapsed into their first copy,
+    optionally with a `count` property, and dangling edges are dropped.
+    """
+
+    def __init__(self, edge_counts=False):
+        self.edge_counts = edge_counts
+        self.node_count = 0
+        self.edge_count = 0
+        self.duplicate_nodes = Counter()  # label -> extra copies
+        self.dangling_edges = Counter()   # type -> edges with a missing endpoint
+        self.duplicate_edges = Counter()  # type -> extra copies
+        self.node_ids = set()
+        self._node_copies = {}  # hash of a duplicated id -> number of records
+        self._edge_copies = {}  # key of a duplicated edge -> number of records
+
+    def check_nodes(self, nodes_data):
+        for node in tqdm(nodes_data, desc="Validating Nodes", unit="node", file=sys.stdout):
+            self.node_count += 1
+            id_hash = _hash64(node.get('id'))
+            if id_hash in self.node_ids:
+                self.duplicate_nodes[node_label(node.get('type'))] += 1
+                self._node_copies[id_hash] = self._node_copies.get(id_hash, 1) + 1
+            else:
+                self.node_ids.add(id_hash)
+
+    def check_edges(self, edges_data):
+        seen = set()
+        node_ids = self.node_ids
+        for edge in tqdm(edges_data, desc="Validating Edges", unit="edge", file=sys.stdout):
+            self.edge_count += 1
+            source_hash = _hash64(edge.get('sourceId'))
+            target_hash = _hash64(edge.get('targetId'))
+            if source_hash not in node_ids or target_hash not in node_ids:
+                self.dangling_edges[rel_type(edge.get('type'))] += 1
+                continue
+            key = _edge_hash(source_hash, target_hash, edge)
+            if key in seen:
+                self.duplicate_edges[rel_type(edge.get('type'))] += 1
+                self._edge_copies[key] = self._edge_copies.get(key, 1) + 1
+            else:
+                seen.add(key)
+
+    def report(self):
+        print(f"Validated {self.node_count} nodes and {self.edge_count} edges.", file=sys.stderr)
+        if self.duplicate_nodes:
+            print(f"Merged {sum(self.duplicate_nodes.values())} duplicate node records "
+                  f"({_by_type(self.duplicate_nodes)}) into {len(self._node_copies)} nodes.", file=sys.stderr)
+        if self.dangling_edges:
+            print(f"Warning: {sum(self.dangling_edges.values())} dangling edges "
+                  f"({_by_type(self.dangling_edges)}) reference node ids missing from the input; "
+                  "they are skipped.", file=sys.stderr)
+        if self.duplicate_edges:
+            print(f"Collapsed {sum(self.duplicate_edges.values())} duplicate edges "
+                  f"({_by_type(self.duplicate_edges)}) into {len(self._edge_copies)} relationships"
+                  + (" with a 'count' property" if self.edge_counts else "")
+                  + "; edges are duplicates only if their source, target, type and properties all match.",
+                  file=sys.stderr)
+
+    def filter_nodes(self, nodes_data):
+        if not self._node_copies:
+            return nodes_data
+        copies = self._node_copies
+
+        def merged_records(records):
+            remaining = dict(copies)
+            pending = {}
+            for node in records:
+                id_hash = _hash64(node.get('id'))
+                if id_hash in remaining:
+                    remaining[id_hash] -= 1
+                    merged = merge_node_records(pending.pop(id_hash, {}), node)
+                    if remaining[id_hash]:
+                        pending[id_hash] = merged
+                        continue
+                    node = merged
+                yield node
+        return _filtered(nodes_data, merged_records)
+
+    def filter_edges(self, edges_data):
+        if not self.dangling_edges and not self._edge_copies:
+            return edges_data
+        copies = self._edge_copies
+        edge_counts = self.edge_counts
+        check_dangling = bool(self.dangling_edges)
+        node_ids = self.node_ids
+
+        def valid_edges(records):
+            written = set()
+            for edge in records:
+                # Each endpoint is hashed once, for the dangling check and the edge key
+                source_hash = _hash64(edge.get('sourceId'))
+                target_hash = _hash64(edge.get('targetId'))
+                if check_dangling and (source_hash not in node_ids or target_hash not in node_ids):
+                    continue
+                if copies:
+                    key = _edge_hash(source_hash, target_hash, edge)
+                    count = copies.get(key)
+                    if count is not None:
+                        if key in written:
+                            continue
+                        written.add(key)
+                        if edge_counts:
+                            edge = dict(edge, count=count)
+                yield edge
+        return _filtered(edges_data, valid_edges)
+
+
+def validate_graph(nodes_data, edges_data, edge_counts=False):
+    """Checks the input before anything is written; one pass over nodes, one over edges.
+
+    Collects the hashed node ids, then counts duplicate node ids, dangling
+    edges and duplicate edges by type. The returned GraphValidation's filters
+    merge or drop them, so the server is sent each node and relationship once
+    and never runs MATCHes that cannot succeed.
+    """
+    validation = GraphValidation(edge_counts)
+    validation.check_nodes(nodes_data)
+    validation.check_edges(edges_data)
+    return validation
+
+# --- Graph Analytics ---
+
+def _csr(node_count, keys, values):
+    """Builds a compressed sparse row adjacency: values[offsets[k]:offsets[k + 1]] are the neighbours of k."""
+    offsets = array('q', [0]) * (node_count + 1)
+    for key in keys:
+        offsets[key + 1] += 1
+    for i in range(node_count):
+        offsets[i + 1] += offsets[i]
+    neighbours = array('q', [0]) * len(keys)
+    positions = offsets[:-1]
+    for key, value in zip(keys, values):
+        neighbours[positions[key]] = value
+        positions[key] += 1
+    return offsets, neighbours
+
+
+class GraphAnalytics:
+    """Per-node metrics of the graph formed by the selected relationship types.
+
+    Nodes are numbered in input order (keyed by the 64-bit id hash, as in
+    GraphValidation) and the edges kept as integer arrays, from which a CSR
+    adjacency is built. Computes fan-in and fan-out, strongly connected
+    components (a node is `recursive` when it sits on a cycle), PageRank,
+    and the topological layer: the longest path from a node without callers
+    through the condensation into components.
+    """
+
+    PROPERTIES = ('fanIn', 'fanOut', 'pageRank', 'sccId', 'sccSize', 'recursive', 'topoLayer')
+
+    def __init__(self, edge_types=None):
+        self.edge_types = edge_types  # Set of relationship types, None for all
+        self.index = {}               # id hash -> node number
+        self.labels = ValueInterner()
+        self.node_labels = array('q')
+        self.sources = array('q')
+        self.targets = array('q')
+        self.annotated_labels = set()
+        self.properties = None
+
+    def index_nodes(self, nodes_data):
+        for node in tqdm(nodes_data, desc="Indexing Nodes", unit="node", file=sys.stdout):
+            id_hash = _hash64(node.get('id'))
+            if id_hash not in self.index:
+                self.index[id_hash] = len(self.index)
+                self.node_labels.append(self.labels.code(node_label(node.get('type'))))
+
+    def add_edges(self, edges_data):
+        endpoint_labels = set()
+        for edge in tqdm(edges_data, desc="Indexing Edges", unit="edge", file=sys.stdout):
+            if self.edge_types is not None and rel_type(edge.get('type')) not in self.edge_types:
+                continue
+            source = self.index.get(_hash64(edge.get('sourceId')))
+            target = self.index.get(_hash64(edge.get('targetId')))
+            if source is None or target is None:
+                continue
+            self.sources.append(source)
+            self.targets.append(target)
+            endpoint_labels.add(self.node_labels[source])
+            endpoint_labels.add(self.node_labels[target])
+        # Restricted to some relationship types, only labels they connect get the properties
+        self.annotated_labels = None if self.edge_types is None else endpoint_labels
+
+    def _components(self, offsets, neighbours):
+        """Iterative Tarjan; components are numbered in reverse topological order."""
+        n = len(self.index)
+        order = array('q', [-1]) * n
+        low = array('q', [0]) * n
+        component = array('q', [-1]) * n
+        on_stack = bytearray(n)
+        stack = []
+        counter = components = 0
+        for root in range(n):
+            if order[root] != -1:
+                continue
+            order[root] = low[root] = counter
+            counter += 1
+            stack.append(root)
+            on_stack[root] = 1
+            work = [[root, offsets[root]]]
+            while work:
+                frame = work[-1]
+                v, i = frame
+                if i < offsets[v + 1]:
+                    frame[1] = i + 1
+                    w = neighbours[i]
+                    if order[w] == -1:
+                        order[w] = low[w] = counter
+                        counter += 1
+                        stack.append(w)
+                        on_stack[w] = 1
+                        work.append([w, offsets[w]])
+                    elif on_stack[w] and order[w] < low[v]:
+                        low[v] = order[w]
+                    continue
+                work.pop()
+                if work and low[v] < low[work[-1][0]]:
+                    low[work[-1][0]] = low[v]
+                if low[v] == order[v]:
+                    while True:
+                        w = stack.pop()
+                        on_stack[w] = 0
+                        component[w] = components
+                        if w == v:
+                            break
+                    components += 1
+        return component, components
+
+    def _page_rank(self, out_degree):
+        """Power iteration; the rank of nodes without outgoing edges is spread over all nodes."""
+        n = len(self.index)
+        if not n:
+            return []
+        rank = [1.0 / n] * n
+        weight = [PAGERANK_DAMPING / degree if degree else 0.0 for degree in out_degree]
+        dangling = [v for v in range(n) if not out_degree[v]]
+        for _ in range(PAGERANK_MAX_ITERATIONS):
+            contribution = list(map(float.__mul__, rank, weight))
+            dangling_rank = sum(map(rank.__getitem__, dangling))
+            new_rank = [(1.0 - PAGERANK_DAMPING + PAGERANK_DAMPING * dangling_rank) / n] * n
+            for source, target in zip(self.sources, self.targets):
+                new_rank[target] += contribution[source]
+            change = sum(map(abs, map(float.__sub__, new_rank, rank)))
+            rank = new_rank
+            if change < PAGERANK_TOLERANCE:
+                break
+        return rank
+
+    def compute(self):
+        n = len(self.index)
+        offsets, neighbours = _csr(n, self.sources, self.targets)
+        out_degree = [offsets[v + 1] - offsets[v] for v in range(n)]
+        in_degree = array('q', [0]) * n
+        for target in self.targets:
+            in_degree[target] += 1
+
+        component, components = self._components(offsets, neighbours)
+        sizes = array('q', [0]) * components
+        for c in component:
+            sizes[c] += 1
+        recursive = bytearray(n)
+        for v, w in zip(self.sources, self.targets):
+            if v == w or sizes[component[v]] > 1:
+                recursive[v] = 1
+
+        # Edges between components run from higher to lower component numbers
+        layer = array('q', [0]) * components
+        for v in sorted(range(n), key=component.__getitem__, reverse=True):
+            c = component[v]
+            for w in neighbours[offsets[v]:offsets[v + 1]]:
+                if component[w] != c and layer[component[w]] <= layer[c]:
+                    layer[component[w]] = layer[c] + 1
+
+        rank = self._page_rank(out_degree)
+        self.properties = (in_degree, out_degree, rank, component, sizes, recursive, layer)
+        self.component_count = components
+        self.recursive_count = sum(recursive)
+        self.layer_count = max(layer) + 1 if components else 0
+
+    def node_properties(self, node):
+        """Returns the analytics properties of a node record, or None if it is not analysed."""
+        v = self.index.get(_hash64(node.get('id')))
+        if v is None or (self.annotated_labels is not None and self.node_labels[v] not in self.annotated_labels):
+            return None
+        in_degree, out_degree, rank, component, sizes, recursive, layer = self.properties
+        c = component[v]
+        values = (in_degree[v], out_degree[v], rank[v], c, sizes[c], bool(recursive[v]), layer[c])
+        return dict(zip(self.PROPERTIES, values))
+
+    def report(self):
+        labels = ("all labels" if self.annotated_labels is None
+                  else ", ".join(sorted(self.labels.values[code] for code in self.annotated_labels)) or "no labels")
+        print(f"Analysed {len(self.sources)} relationships between {len(self.index)} nodes: "
+              f"{self.recursive_count} nodes on cycles, {self.layer_count} topological layers; "
+              f"properties are written to {labels}.", file=sys.stderr)
+
+    def annotate_nodes(self, nodes_data):
+        """Adds the properties to the node records: in place for lists, lazily for streams."""
+        if isinstance(nodes_data, list):
+            for node in nodes_data:
+                properties = self.node_properties(node)
+                if properties:
+                    node.update(properties)
+            return nodes_data
+
+        def annotated(records):
+            for node in records:
+                properties = self.node_properties(node)
+                yield dict(node, **properties) if properties else node
+        return FilteredRecords(nodes_data, annotated)
+
+
+def analyze_graph(nodes_data, edges_data, edge_types=None):
+    """Computes the analytics of the graph; one pass over nodes, one over the edges of edge_types."""
+    analytics = GraphAnalytics(edge_types)
+    analytics.index_nodes(nodes_data)
+    analytics.add_edges(edges_data)
+    analytics.compute()
+    return analytics
+
+# --- Batch Sizing ---
+
+def estimate_record_bytes(record):
+    """Cheap estimate of a record's parameter payload size (no serialization)."""
+    size = 16
+    for key, value in record.items():
+        size += len(key) + 8
+        if isinstance(value, str):
+            size += len(value)
+        elif isinstance(value, (list, tuple)):
+            size += sum(len(v) + 8 if isinstance(v, str) else 8 for v in value)
+        elif isinstance(value, dict):
+            size += estimate_record_bytes(value)
+    return size
+
+
+class FixedBatchSizer:
+    """Closes batches at a fixed row count (--db-batch-size)."""
+
+    adaptive = False
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    def measure(self, record):
+        return 0
+
+    def full(self, rows, nbytes):
+        return rows >= self.rows
+
+    def observe(self, rows, seconds):
+        pass
+
+    def shrink(self):
+        pass
+
+    def describe(self):
+        return f"batches of {self.rows}"
+
+
+class AdaptiveBatchSizer:
+    """Sizes batches by row count and estimated payload bytes.
+
+    A batch is closed when it reaches the current row target or the byte cap,
+    whichever comes first, so batches of large method nodes stay small while
+    batches of tiny namespace nodes grow. After every commit the row target is
+    moved toward smoothed throughput * target latency (at most halving or
+    doubling per step). Memory-limit failures halve both limits.
+    """
+
+    adaptive = True
+    SMOOTHING = 0.3
+
+    def __init__(self, initial_rows, target_latency=DEFAULT_TARGET_LATENCY,
+                 max_bytes=DEFAULT_MAX_BATCH_BYTES,
+                 min_rows=MIN_ADAPTIVE_BATCH_ROWS, max_rows=MAX_ADAPTIVE_BATCH_ROWS):
+        self.min_rows = min_rows
+        self.max_rows = max_rows
+        self.rows = max(min_rows, min(max_rows, initial_rows))
+        self.target_latency = target_latency
+        self.max_bytes = max_bytes
+        self._rate = None
+        self._lock = threading.Lock()
+
+    def measure(self, record):
+        return estimate_record_bytes(record)
+
+    def full(self, rows, nbytes):
+        return rows >= self.rows or nbytes >= self.max_bytes
+
+    def observe(self, rows, seconds):
+        """Feeds back the commit latency of a batch of `rows` records."""
+        if seconds <= 0 or rows <= 0:
+            return
+        with self._lock:
+            rate = rows / seconds
+            self._rate = rate if self._rate is None else (1 - self.SMOOTHING) * self._rate + self.SMOOTHING * rate
+            target = self._rate * self.target_latency
+            target = min(max(target, self.rows / 2), self.rows * 2)
+            self.rows = int(min(max(target, self.min_rows), self.max_rows))
+
+    def shrink(self):
+        """Halves the limits after the server ran out of memory for a batch."""
+        with self._lock:
+            self.rows = max(self.min_rows, self.rows // 2)
+            self.max_bytes = max(64 * 1024, self.max_bytes // 2)
+
+    def describe(self):
+        return (f"adaptive batches (starting at {self.rows} rows, "
+                f"target {self.target_latency:g}s, cap {self.max_bytes} bytes)")
+
+
+def as_batch_sizer(batch_size):
+    """Accepts either a row count or a sizer object."""
+    return FixedBatchSizer(batch_size) if isinstance(batch_size, int) else batch_size
+
+def make_batch_sizer(args):
+    """Returns the sizer configured on the command line (a fresh one per phase)."""
+    if args.adaptive_batching:
+        return AdaptiveBatchSizer(args.db_batch_size, args.target_latency, args.max_batch_bytes)
+    return FixedBatchSizer(args.db_batch_size)
+
+# --- Checkpointing ---
+
+def input_fingerprint(paths):
+    """Identifies the input by size, modification time and a hash of the first megabyte of each file."""
+    if isinstance(paths, str):
+        paths = [paths]
+    fingerprints = []
+    for path in paths:
+        stat = os.stat(path)
+        with open(path, 'rb') as f:
+            head = hashlib.blake2b(f.read(1 << 20), digest_size=16).hexdigest()
+        fingerprints.append(f"{stat.st_size}:{stat.st_mtime_ns}:{head}")
+    if len(fingerprints) == 1:
+        return fingerprints[0]
+    # Shard names are included, so renaming or reordering shards invalidates a checkpoint
+    combined = "\n".join(f"{os.path.basename(path)}={fp}" for path, fp in zip(paths, fingerprints))
+    return f"{len(paths)} shards:" + hashlib.blake2b(combined.encode('utf-8'), digest_size=16).hexdigest()
+
+
+class PhaseProgress:
+    """Committed input records of one phase ('nodes' or 'edges').
+
+    Records are numbered by their position within their partition's stream
+    (there is a single partition unless --workers is used). Each partition
+    keeps a contiguous committed prefix plus the committed ranges beyond it,
+    which only exist while batches complete out of order (--async).
+    """
+
+    def __init__(self, checkpoint, state):
+        self._checkpoint = checkpoint
+        self._state = state
+        state.setdefault('complete', False)
+        state.setdefault('partitions', {})
+
+    @property
+    def complete(self):
+        return self._state['complete']
+
+    def _partition(self, partition):
+        return self._state['partitions'].setdefault(str(partition), {'done': 0, 'ranges': []})
+
+    def is_committed(self, partition, index):
+        if self._state['complete']:
+            return True
+        part = self._state['partitions'].get(str(partition))
+        if part is None:
+            return False
+        return index < part['done'] or any(start <= index < end for start, end in part['ranges'])
+
+    def mark(self, partition, start, end):
+        """Records [start, end) as committed and saves the checkpoint."""
+        with self._checkpoint.lock:
+            part = self._partition(partition)
+            ranges = sorted(part['ranges'] + [[start, end]])
+            remaining = []
+            for range_start, range_end in ranges:
+                if range_start <= part['done']:
+                    part['done'] = max(part['done'], range_end)
+                else:
+                    remaining.append([range_start, range_end])
+            part['ranges'] = remaining
+            self._checkpoint.save()
+
+    def finish(self):
+        with self._checkpoint.lock:
+            self._state['complete'] = True
+            self._checkpoint.save()
+
+
+class ImportCheckpoint:
+    """JSON file recording which batches of an import have been committed.
+
+    It is rewritten after every committed batch, so a rerun with --resume
+    neither repeats committed node writes nor duplicates created edges. The
+    file is tied to the input by a fingerprint and to the worker count, which
+    determines how records are partitioned.
+    """
+
+    def __init__(self, path, fingerprint, workers):
+        self.path = path
+        self.lock = threading.Lock()
+        self._state = {'fingerprint': fingerprint, 'workers': workers, 'phases': {}}
+
+    @classmethod
+    def load(cls, path, fingerprint):
+        """Returns the checkpoint stored at path, or None if it is missing or for another input."""
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+            if not isinstance(state, dict):
+                raise ValueError("not a JSON object")
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            # E.g. truncated by a crash while it was written without the atomic rename
+            print(f"Warning: ignoring unreadable checkpoint '{path}': {e}", file=sys.stderr)
+            return None
+        if state.get('fingerprint') != fingerprint:
+            print(f"Checkpoint '{path}' belongs to a different input file; ignoring it.", file=sys.stderr)
+            return None
+        checkpoint = cls(path, fingerprint, state.get('workers', 1))
+        checkpoint._state = state
+        return checkpoint
+
+    @staticmethod
+    def stored_fingerprint(path):
+        """Returns the fingerprint recorded in the checkpoint at path, or None if there is no readable one."""
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return state.get('fingerprint') if isinstance(state, dict) else None
+
+    @property
+    def workers(self):
+        return self._state['workers']
+
+    @property
+    def started(self):
+        """True once the checkpoint file exists, i.e. at least one batch was recorded."""
+        return os.path.exists(self.path)
+
+    def phase(self, name):
+        return PhaseProgress(self, self._state['phases'].setdefault(name, {}))
+
+    def save(self):
+        """Atomically rewrites the checkpoint file."""
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self._state, f)
+        os.replace(tmp_path, self.path)
+
+    def remove(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def partition_of(key, partitions):
+    """Stable partition for a record key (unlike hash(), identical across runs)."""
+    return zlib.crc32(str(key).encode('utf-8')) % partitions
+
+def index_batches(records, batch_size, progress=None, partition=0):
+    """Yields (batch, start, end) for records not yet committed according to progress.
+
+    batch_size is a row count or a batch sizer. start/end delimit the input
+    positions covered by the batch; the range may include skipped positions,
+    which were committed already.
+    """
+    sizer = as_batch_sizer(batch_size)
+    batch, start, last, nbytes = [], 0, 0, 0
+    for index, record in enumerate(records):
+        if progress is not None and progress.is_committed(partition, index):
+            continue
+        if not batch:
+            start = index
+        batch.append(record)
+        nbytes += sizer.measure(record)
+        last = index
+        if sizer.full(len(batch), nbytes):
+            yield batch, start, last + 1
+            batch, nbytes = [], 0
+    if batch:
+        yield batch, start, last + 1
+
+# --- Metrics ---
+
+def _percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, math.ceil(fraction * len(sorted_values)) - 1))
+    return round(sorted_values[index], 6)
+
+
+class PhaseMetrics:
+    """Batch latencies, row counts and retries of one write phase (nodes or edges)."""
+
+    QUANTILES = (0.5, 0.9, 0.99)
+
+    def __init__(self):
+        self.rows = 0        # Rows the sink reported as written
+        self.sent = 0        # Rows submitted
+        self.seconds = 0.0
+        self.retries = 0
+        self.rejected = 0
+        self._latencies = []
+        self._lock = threading.Lock()
+
+    def observe_batch(self, seconds):
+        with self._lock:
+            self._latencies.append(seconds)
+
+    def retry(self):
+        with self._lock:
+            self.retries += 1
+
+    def reject(self):
+        with self._lock:
+            self.rejected += 1
+
+    def report(self):
+        latencies = sorted(self._latencies)
+        return {
+            'rows': self.rows,
+            'sent': self.sent,
+            'seconds': round(self.seconds, 6),
+            'rows_per_second': round(self.rows / self.seconds, 3) if self.seconds else None,
+            'batches': len(latencies),
+            'retries': self.retries,
+            'rejected': self.rejected,
+            'batch_latency_seconds': {
+                **{f"p{round(q * 100)}": _percentile(latencies, q) for q in self.QUANTILES},
+                'max': round(latencies[-1], 6) if latencies else None,
+                'sum': round(sum(latencies), 6),
+            },
+        }
+
+
+class ImportMetrics:
+    """Per-stage timings and per-phase write metrics of one run, exported as JSON or Prometheus text."""
+
+    def __init__(self):
+        self.started = time.time()
+        self.stages = {}
+        self.phases = {}
+        self.parse = None
+        self.success = False
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + time.perf_counter() - started
+
+    def phase(self, name):
+        return self.phases.setdefault(name, PhaseMetrics())
+
+    def record_parse(self, decoder, input_bytes, records, seconds):
+        """Records the throughput of loading the input (bytes as stored on disk, possibly compressed)."""
+        self.parse = {
+            'decoder': decoder,
+            'input_bytes': input_bytes,
+            'records': records,
+            'seconds': round(seconds, 6),
+            'bytes_per_second': round(input_bytes / seconds, 3) if seconds else None,
+            'records_per_second': round(records / seconds, 3) if seconds else None,
+        }
+
+    def report(self):
+        return {
+            'success': self.success,
+            'started_at': self.started,
+            'duration_seconds': round(time.time() - self.started, 6),
+            'stages': {name: round(seconds, 6) for name, seconds in self.stages.items()},
+            'phases': {name: phase.report() for name, phase in self.phases.items()},
+            'parse': self.parse,
+        }
+
+    def prometheus_text(self, report=None):
+        """Renders the report in the Prometheus text exposition format (for the node_exporter textfile collector)."""
+        report = report or self.report()
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f"# HELP populate_graph_{name} {help_text}")
+            lines.append(f"# TYPE populate_graph_{name} {kind}")
+            for labels, value in samples:
+                if value is None:
+                    continue
+                label_text = ",".join(f'{key}="{val}"' for key, val in labels.items())
+                lines.append(f"populate_graph_{name}{{{label_text}}} {value}" if label_text
+                             else f"populate_graph_{name} {value}")
+
+        phases = report['phases']
+        metric("success", "gauge", "1 if the last import succeeded, 0 otherwise.",
+               [({}, int(report['success']))])
+        metric("last_run_timestamp_seconds", "gauge", "Start time of the last import.",
+               [({}, report['started_at'])])
+        metric("duration_seconds", "gauge", "Wall time of the last import.", [({}, report['duration_seconds'])])
+        metric("stage_seconds", "gauge", "Wall time per import stage.",
+               [({'stage': name}, seconds) for name, seconds in report['stages'].items()])
+        parse = report['parse']
+        if parse:
+            labels = {'decoder': parse['decoder']}
+            metric("parse_bytes_per_second", "gauge", "Input bytes (as stored) loaded per second.",
+                   [(labels, parse['bytes_per_second'])])
+            metric("parse_records_per_second", "gauge", "Node and edge records decoded per second.",
+                   [(labels, parse['records_per_second'])])
+        metric("rows", "gauge", "Rows written per phase.",
+               [({'phase': name}, phase['rows']) for name, phase in phases.items()])
+        metric("rows_per_second", "gauge", "Write throughput per phase.",
+               [({'phase': name}, phase['rows_per_second']) for name, phase in phases.items()])
+        metric("retries", "gauge", "Transient-error retries per phase.",
+               [({'phase': name}, phase['retries']) for name, phase in phases.items()])
+        metric("rejected", "gauge", "Records rejected by the server per phase.",
+               [({'phase': name}, phase['rejected']) for name, phase in phases.items()])
+        samples = []
+        for name, phase in phases.items():
+            latency = phase['batch_latency_seconds']
+            for q in PhaseMetrics.QUANTILES:
+                samples.append(({'phase': name, 'quantile': str(q)}, latency[f"p{round(q * 100)}"]))
+        metric("batch_latency_seconds", "summary", "Commit latency of write batches.", samples)
+        lines += [f'populate_graph_batch_latency_seconds_sum{{phase="{name}"}} {phase["batch_latency_seconds"]["sum"]}'
+                  for name, phase in phases.items()]
+        lines += [f'populate_graph_batch_latency_seconds_count{{phase="{name}"}} {phase["batches"]}'
+                  for name, phase in phases.items()]
+        return "\n".join(lines) + "\n"
+
+    def write(self, json_path=None, prometheus_path=None):
+        """Writes the JSON report and/or the Prometheus textfile, each atomically."""
+        report = self.report()
+        for path, text in ((json_path, lambda: json.dumps(report, indent=2)),
+                           (prometheus_path, lambda: self.prometheus_text(report))):
+            if path:
+                tmp_path = path + ".tmp"
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    f.write(text())
+                os.replace(tmp_path, path)
+
+def write_metrics(metrics, args):
+    """Writes the --metrics-json and --metrics-prom files, if requested; a failure only warns."""
+    if not (args.metrics_json or args.metrics_prom):
+        return
+    try:
+        metrics.write(args.metrics_json, args.metrics_prom)
+    except OSError as e:
+        print(f"Warning: could not write metrics: {e}", file=sys.stderr)
+
+# --- Neo4j Interaction Functions ---
+
+CLEAR_RELATIONSHIPS_QUERY = """
+MATCH ()-[r]->()
+WITH r LIMIT $limit
+CALL { WITH r DELETE r } IN TRANSACTIONS OF $batch_size ROWS
+RETURN count(*) AS deleted
+"""
+
+CLEAR_NODES_QUERY = """
+MATCH (n)
+WITH n LIMIT $limit
+CALL { WITH n DETACH DELETE n } IN TRANSACTIONS OF $batch_size ROWS
+RETURN count(*) AS deleted
+"""
+
+def _delete_in_chunks(session, query, total, desc, batch_size):
+    """Repeats a CALL IN TRANSACTIONS delete query until it deletes nothing."""
+    limit = batch_size * CLEAR_TRANSACTIONS_PER_QUERY
+    with tqdm(total=total, desc=desc, unit="row", file=sys.stdout) as pbar:
+        while True:
+            # CALL ... IN TRANSACTIONS only runs in auto-commit transactions, hence session.run
+            record = session.run(query, limit=limit, batch_size=batch_size).single()
+            deleted = record["deleted"] if record else 0
+            if not deleted:
+                return
+            pbar.update(deleted)
+
+def recreate_database(driver, db_name):
+    """Drops and recreates the database from the system database (admin only)."""
+    print(f"Recreating database '{db_name}'...", file=sys.stderr)
+    try:
+        with driver.session(database="system") as session:
+            session.run("CREATE OR REPLACE DATABASE $name WAIT", name=db_name).consume()
+        print("Database recreated successfully.", file=sys.stderr)
+    except Exception as e:
+        print(f"Error recreating database: {e}", file=sys.stderr)
+        print("Recreating requires admin rights and multi-database support; "
+              "use --clear without --recreate-database otherwise.", file=sys.stderr)
+        raise
+
+def clear_database(driver, db_name, batch_size=DEFAULT_CLEAR_BATCH_SIZE):
+    """Deletes all relationships, then all nodes, in bounded transactions.
+
+    A single DETACH DELETE of the whole graph has to hold every deletion in one
+    transaction; deleting in chunks keeps transaction memory bounded and
+    reports progress. Relationships go first so node deletes stay cheap.
+    """
+    print(f"Clearing database '{db_name}' in batches of {batch_size}...", file=sys.stderr)
+    try:
+        with driver.session(database=db_name) as session:
+            # Both counts come from the count store and are cheap
+            rel_total = session.run("MATCH ()-[r]->() RETURN count(r) AS total").single()["total"]
+            node_total = session.run("MATCH (n) RETURN count(n) AS total").single()["total"]
+            if rel_total:
+                _delete_in_chunks(session, CLEAR_RELATIONSHIPS_QUERY, rel_total, "Deleting Edges", batch_size)
+            if node_total:
+                _delete_in_chunks(session, CLEAR_NODES_QUERY, node_total, "Deleting Nodes", batch_size)
+        print("Database cleared successfully.", file=sys.stderr)
+    except Exception as e:
+        print(f"Error clearing database: {e}", file=sys.stderr)
+        raise
+
+def discover_node_labels(nodes_data):
+    """Returns the sorted set of node labels present in the input.
+
+    For a streamed input this is an extra pass over the nodes array.
+    """
+    return sorted({node_label(node.get('type')) for node in nodes_data})
+
+def create_constraints(driver, db_name, labels, index_timeout=DEFAULT_INDEX_TIMEOUT):
+    """Creates unique id constraints per node label and for the shared lookup label.
+
+    Each constraint is backed by a range index, which is what lets the labelled
+    MERGE in insert_nodes and the endpoint MATCH in insert_edges avoid full scans.
+    Blocks until all indexes are ONLINE so inserts never run against a
+    populating index.
+    """
+    all_labels = [LOOKUP_LABEL] + [label for label in labels if label != LOOKUP_LABEL]
+    print(f"Ensuring unique 'id' constraints for {len(all_labels)} labels...", file=sys.stderr)
+    try:
+        with driver.session(database=db_name) as session:
+            for label in all_labels:
+                name = quote_name(f"{label}_id_unique")
+                session.run(
+                    f"CREATE CONSTRAINT {name} IF NOT EXISTS "
+                    f"FOR (n:{quote_name(label)}) REQUIRE n.id IS UNIQUE"
+                ).consume()
+            print(f"Waiting up to {index_timeout}s for indexes to come ONLINE...", file=sys.stderr)
+            session.run("CALL db.awaitIndexes($timeout)", timeout=index_timeout).consume()
+        print("Constraints and indexes are ready.", file=sys.stderr)
+    except Exception as e:
+        print(f"Error creating constraints: {e}", file=sys.stderr)
+        print("Existing nodes with duplicate ids prevent unique constraint creation; "
+              "consider running with --clear.", file=sys.stderr)
+        raise
+
+_node_query_cache = {}
+
+def node_merge_query(label, return_element_ids=False):
+    """Builds (and caches) the labelled MERGE query for one node label.
+
+    Labels cannot be passed as parameters, so each label gets its own static
+    query text. Using a label in MERGE lets the planner use the label's id index
+    instead of scanning every node. With return_element_ids, the query returns
+    one (id, element_id) row per node instead of a count.
+    """
+    key = (label, return_element_ids)
+    query = _node_query_cache.get(key)
+    if query is None:
+        if return_element_ids:
+            returns = "RETURN node_data.id as id, elementId(n) as element_id"
+        else:
+            returns = "RETURN count(n) as processed_nodes_count"
+        query = f"""
+    UNWIND $batch as node_data
+    MERGE (n:{quote_name(label)} {{id: node_data.id}})
+    SET n = node_data, n:{quote_name(LOOKUP_LABEL)} // Overwrite/set all properties from the map
+    {returns}
+    """
+        _node_query_cache[key] = query
+    return query
 
+_edge_query_cache = {}
 
-    args = parser.parse_args()
-    if not args.password:
-        print("Warning: Neo4j password not provided via --password or NEO4J_PASSWORD env var.", file=sys.stderr)
-    return args
+def edge_create_query(edge_type, source_label, target_label):
+    """Builds (and caches) the static CREATE query for one (type, source label, target label) group.
+
+    Groups with None labels hold endpoints resolved to element ids, which are
+    matched directly without an index lookup. Edge properties are set in the
+    same statement that creates the relationship.
+    """
+    key = (edge_type, source_label, target_label)
+    query = _edge_query_cache.get(key)
+    if query is None:
+        if source_label is None:
+            match = """
+    MATCH (source) WHERE elementId(source) = edge_data.sourceElementId
+    MATCH (target) WHERE elementId(target) = edge_data.targetElementId"""
+        else:
+            match = f"""
+    MATCH (source:{quote_name(source_label)} {{id: edge_data.sourceId}})
+    MATCH (target:{quote_name(target_label)} {{id: edge_data.targetId}})"""
+        query = f"""
+    UNWIND $batch as edge_data{match}
+    CREATE (source)-[r:{quote_name(edge_type)}]->(target)
+    SET r = edge_data.properties
+    RETURN count(r) as created_edge_count
+    """
+        _edge_query_cache[key] = query
+    return query
+
+
+class ElementIdCache:
+    """Compact id -> elementId map of the nodes written in this run.
+
+    Element ids of one database look like '<n>:<database id>:<number>', so the
+    shared prefix is stored once and only the number is kept per node. Only
+    filled from committed transactions, since ids of rolled-back nodes can be
+    reused.
+    """
+
+    def __init__(self):
+        self._prefix = None
+        self._ids = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._ids)
+
+    def update(self, pairs):
+        with self._lock:
+            for node_id, element_id in pairs:
+                prefix, _, number = element_id.rpartition(":")
+                if self._prefix is None:
+                    self._prefix = prefix
+                if prefix == self._prefix and number.isdigit():
+                    self._ids[node_id] = int(number)
+                else:
+                    self._ids[node_id] = element_id
+
+    def get(self, node_id):
+        value = self._ids.get(node_id)
+        if value is None or isinstance(value, str):
+            return value
+        return f"{self._prefix}:{value}"
+
+
+def group_edges(batch, label_index, element_ids=None):
+    """Splits a batch of edge records into {(type, source label, target label): [rows]}.
+
+    Edges whose endpoints are both in element_ids go to a (type, None, None)
+    group matched by element id. Otherwise endpoint labels come from
+    label_index (id -> label, filled by insert_nodes); ids that are not in it
+    fall back to the shared lookup label. Rows carry the endpoints and the
+    edge's other keys as a properties map, and are ordered by target so
+    concurrent transactions take endpoint locks in a consistent order.
+    """
+    groups = {}
+    for edge in batch:
+        source_id = edge.get('sourceId')
+        target_id = edge.get('targetId')
+        edge_type = rel_type(edge.get('type'))
+        if element_ids is not None:
+            source_element = element_ids.get(source_id)
+            target_element = element_ids.get(target_id)
+            if source_element is not None and target_element is not None:
+                groups.setdefault((edge_type, None, None), []).append({
+                    'sourceElementId': source_element,
+                    'targetElementId': target_element,
+                    'properties': edge_properties(edge),
+                })
+                continue
+        key = (
+            edge_type,
+            label_index.get(source_id, LOOKUP_LABEL),
+            label_index.get(target_id, LOOKUP_LABEL),
+        )
+        groups.setdefault(key, []).append(
+            {'sourceId': source_id, 'targetId': target_id, 'properties': edge_properties(edge)})
+    for rows in groups.values():
+        rows.sort(key=lambda row: str(row.get('targetId', row.get('targetElementId'))))
+    return groups
+
+def _write_node_batch(tx, groups):
+    """Runs one labelled MERGE per node group inside a single transaction."""
+    count = 0
+    for label, rows in groups.items():
+        result = tx.run(node_merge_query(label), batch=rows).single()
+        count += result["processed_nodes_count"] if result else 0
+    return count
+
+def _write_node_batch_with_ids(tx, groups):
+    """Like _write_node_batch, but returns the (id, elementId) pairs of the written nodes."""
+    pairs = []
+    for label, rows in groups.items():
+        result = tx.run(node_merge_query(label, return_element_ids=True), batch=rows)
+        pairs.extend((record["id"], record["element_id"]) for record in result)
+    return pairs
+
+def _write_edge_batch(tx, groups):
+    """Runs one static CREATE per edge group inside a single transaction."""
+    count = 0
+    for (edge_type, source_label, target_label), rows in groups.items():
+        result = tx.run(edge_create_query(edge_type, source_label, target_label), batch=rows).single()
+        count += result["created_edge_count"] if result else 0
+    return count
+
+def classify_error(error):
+    """Sorts a write failure into 'transient', 'oversize', 'data' or 'fatal'.
+
+    transient: rolled back for reasons unrelated to the data (deadlock, leader
+        switch, lost connection, timeout); replaying the same batch can succeed.
+    oversize: the batch hit a server memory limit; smaller batches can succeed.
+    data: the server refused something in the batch (constraint violation,
+        unsupported property value); bisecting finds the offending records.
+    fatal: anything else, e.g. a broken query, missing permissions, a missing
+        database or a terminated transaction.
+    """
+    code = getattr(error, 'code', None) or ""
+    if "OutOfMemory" in code or "MemoryLimit" in code:
+        return 'oversize'
+    if isinstance(error, RETRYABLE_ERRORS) or "TransactionTimedOut" in code:
+        return 'transient'
+    if code in DATA_ERROR_CODES:
+        return 'data'
+    # The driver raises these while packing parameters it cannot serialize
+    if isinstance(error, (TypeError, ValueError)) and not isinstance(error, Neo4jError):
+        return 'data'
+    return 'fatal'
+
+def _retry_delay(attempt):
+    """Jittered exponential backoff."""
+    return min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt) * random.uniform(0.5, 1.5)
+
+def write_with_retry(session, work, payload, max_retries=DEFAULT_MAX_RETRIES, metrics=None):
+    """Runs work(tx, payload) in a write transaction of a sink session, retrying transient failures.
+
+    The driver already retries inside execute_write for a limited time; this
+    outer loop adds jittered exponential backoff so that deadlocks between
+    parallel workers and cluster leader switches do not abort the import.
+    """
+    for attempt in range(max_retries + 1):
+        try:
+            return session.execute_write(work, payload)
+        except Exception as e:
+            if attempt == max_retries or classify_error(e) != 'transient':
+                raise
+            delay = _retry_delay(attempt)
+            print(f"\nTransient error ({type(e).__name__}), retrying in {delay:.1f}s "
+                  f"(attempt {attempt + 1}/{max_retries}): {e}", file=sys.stderr)
+            if metrics is not None:
+                metrics.retry()
+            time.sleep(delay)
 
-# --- Neo4j Interaction Functions ---
 
-# clear_database and create_constraints remain the same
-def clear_database(driver, db_name):
-    """Deletes all nodes and relationships in the specified database."""
-    print(f"Clearing database '{db_name}'...", file=sys.stderr)
+class TooManyRejectsError(Exception):
+    """Raised when more records were rejected than --max-rejects allows."""
+
+
+class RejectLog:
+    """Collects records the server refused, appending them to a JSON Lines file."""
+
+    def __init__(self, path, max_rejects=DEFAULT_MAX_REJECTS):
+        self.path = path
+        self.max_rejects = max_rejects
+        self.count = 0
+        self._lock = threading.Lock()
+        self._file = None
+
+    def add(self, kind, record, error):
+        with self._lock:
+            if self._file is None:
+                self._file = open(self.path, 'a', encoding='utf-8')
+            line = {'kind': kind, 'error': f"{type(error).__name__}: {error}", 'record': record}
+            self._file.write(json.dumps(line, ensure_ascii=False, default=str) + "\n")
+            self._file.flush()
+            self.count += 1
+            if self.count > self.max_rejects:
+                raise TooManyRejectsError(
+                    f"More than {self.max_rejects} records were rejected (see '{self.path}'); aborting.")
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def commit_batch(session, work, prepare, batch, max_retries=DEFAULT_MAX_RETRIES,
+                 rejects=None, kind="record", payload=None, sizer=None, on_commit=None, metrics=None):
+    """Commits one batch, bisecting it when the server refuses part of it.
+
+    Transient failures are retried by write_with_retry. When the failure is
+    caused by the data (or by the batch's size), the batch is split in halves
+    that are committed separately, down to single records, which are then
+    written to the reject log instead of aborting the import. Memory-limit
+    failures also shrink the batch sizer. Returns the count reported by work()
+    for the committed records; when work() returns something else, on_commit
+    receives each committed result and turns it into that count. Retries
+    and rejects are counted in metrics (a PhaseMetrics) when given.
+    """
     try:
-        with driver.session(database=db_name) as session:
-            # Use execute_write for potentially longer operations
-            session.execute_write(lambda tx: tx.run("MATCH (n) DETACH DELETE n"))
-        print("Database cleared successfully.", file=sys.stderr)
+        result = write_with_retry(session, work, prepare(batch) if payload is None else payload, max_retries,
+                                  metrics)
+        return on_commit(result) if on_commit is not None else result
     except Exception as e:
-        print(f"Error clearing database: {e}", file=sys.stderr)
-        raise
+        error_class = classify_error(e)
+        if error_class == 'oversize' and sizer is not None:
+            sizer.shrink()
+        if rejects is None or error_class not in ('data', 'oversize'):
+            raise
+        if len(batch) == 1:
+            rejects.add(kind, batch[0], e)
+            if metrics is not None:
+                metrics.reject()
+            return 0
+    mid = len(batch) // 2
+    return (commit_batch(session, work, prepare, batch[:mid], max_retries, rejects, kind,
+                         sizer=sizer, on_commit=on_commit, metrics=metrics)
+            + commit_batch(session, work, prepare, batch[mid:], max_retries, rejects, kind,
+                           sizer=sizer, on_commit=on_commit, metrics=metrics))
+
+
+class ParallelWriter:
+    """Commits batches on N worker threads, each holding its own session.
+
+    Every partition is owned by exactly one worker, so batches of the same
+    partition are committed serially and never contend with each other. Worker
+    queues are bounded, which keeps the reader from running far ahead of the
+    database.
+    """
+
+    def __init__(self, sink, workers, prepare, work, pbar, max_retries=DEFAULT_MAX_RETRIES,
+                 progress=None, rejects=None, kind="record", sizer=None, on_commit=None, metrics=None):
+        self._sink = sink
+        self._metrics = metrics
+        self._sizer = sizer
+        self._on_commit = on_commit
+        self._prepare = prepare
+        self._work = work
+        self._rejects = rejects
+        self._kind = kind
+        self._pbar = pbar
+        self._max_retries = max_retries
+        self._progress = progress
+        self._lock = threading.Lock()
+        self._errors = []
+        self.processed_count = 0
+        self._queues = [queue.Queue(maxsize=2) for _ in range(workers)]
+        self._threads = [
+            threading.Thread(target=self._run, args=(i, q), name=f"writer-{i}", daemon=True)
+            for i, q in enumerate(self._queues)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def _run(self, partition, q):
+        failed = False
+        with self._sink.session() as session:
+            while True:
+                item = q.get()
+                if item is None:
+                    return
+                if failed:
+                    continue  # Keep draining so the producer never blocks on a dead worker
+                batch, start, end = item
+                try:
+                    started = time.perf_counter()
+                    count = commit_batch(session, self._work, self._prepare, batch, self._max_retries,
+                                         self._rejects, self._kind, sizer=self._sizer,
+                                         on_commit=self._on_commit, metrics=self._metrics)
+                    elapsed = time.perf_counter() - started
+                    if self._sizer is not None:
+                        self._sizer.observe(len(batch), elapsed)
+                    if self._metrics is not None:
+                        self._metrics.observe_batch(elapsed)
+                    # Saving the checkpoint can fail too (disk full, read-only directory)
+                    if self._progress is not None:
+                        self._progress.mark(partition, start, end)
+                    with self._lock:
+                        self.processed_count += count
+                        self._pbar.update(len(batch))
+                except Exception as e:
+                    failed = True
+                    with self._lock:
+                        self._errors.append(e)
+
+    def submit(self, partition, batch, start, end):
+        if self._errors:
+            raise self._errors[0]
+        self._queues[partition].put((batch, start, end))
+
+    def close(self):
+        """Waits for all queued batches and re-raises the first worker error."""
+        for q in self._queues:
+            q.put(None)
+        for thread in self._threads:
+            thread.join()
+        if self._errors:
+            raise self._errors[0]
+
+
+def _write_records(sink, records, batch_size, prepare, work, pbar,
+                   workers=1, partition_key=None, max_retries=DEFAULT_MAX_RETRIES, progress=None,
+                   rejects=None, kind="record", on_commit=None, metrics=None):
+    """Batches records, turns each batch into a payload with prepare() and commits it to the sink with work().
+
+    batch_size is a row count or a batch sizer, which is fed the latency of
+    every commit. With workers > 1, records are hash-partitioned on
+    partition_key(record) and each partition is batched and written by its own
+    worker session. With a PhaseProgress, already committed records are
+    skipped and every commit is recorded. With a RejectLog, records the server
+    refuses are isolated and logged instead of failing the import. on_commit
+    and metrics are passed on to commit_batch; metrics also records every
+    batch's commit latency. Returns (processed_count, sent_count).
+    """
+    sizer = as_batch_sizer(batch_size)
+    sent_count = 0
+    if workers <= 1:
+        processed_count = 0
+        with sink.session() as session:
+            for batch, start, end in index_batches(records, sizer, progress):
+                # Use execute_write for transactional safety per batch
+                started = time.perf_counter()
+                processed_count += commit_batch(session, work, prepare, batch, max_retries, rejects, kind,
+                                                sizer=sizer, on_commit=on_commit, metrics=metrics)
+                elapsed = time.perf_counter() - started
+                sizer.observe(len(batch), elapsed)
+                if metrics is not None:
+                    metrics.observe_batch(elapsed)
+                if progress is not None:
+                    progress.mark(0, start, end)
+                sent_count += len(batch)
+                pbar.update(len(batch)) # Update progress bar by number of items in batch
+        return processed_count, sent_count
+
+    writer = ParallelWriter(sink, workers, prepare, work, pbar, max_retries, progress, rejects, kind,
+                            sizer, on_commit, metrics)
+    buffers = [[] for _ in range(workers)]
+    buffer_bytes = [0] * workers
+    starts = [0] * workers
+    positions = [0] * workers  # Next position within each partition's stream
+    try:
+        for record in records:
+            partition = partition_of(partition_key(record), workers)
+            index = positions[partition]
+            positions[partition] += 1
+            if progress is not None and progress.is_committed(partition, index):
+                continue
+            buffer = buffers[partition]
+            if not buffer:
+                starts[partition] = index
+            buffer.append(record)
+            buffer_bytes[partition] += sizer.measure(record)
+            if sizer.full(len(buffer), buffer_bytes[partition]):
+                writer.submit(partition, buffer, starts[partition], index + 1)
+                sent_count += len(buffer)
+                buffers[partition] = []
+                buffer_bytes[partition] = 0
+        for partition, buffer in enumerate(buffers):
+            if buffer:
+                writer.submit(partition, buffer, starts[partition], positions[partition])
+                sent_count += len(buffer)
+    finally:
+        writer.close()
+    return writer.processed_count, sent_count
+
+
+def _record_count(records):
+    """Returns len(records) for sized inputs and None for streams."""
+    return len(records) if hasattr(records, '__len__') else None
+
+def _node_preparer(label_index):
+    """Returns prepare(batch) for node batches; records id -> label when label_index is given."""
+    def prepare(batch):
+        groups = group_by_label(batch)
+        if label_index is not None:
+            for label, rows in groups.items():
+                label = sys.intern(label)
+                for node in rows:
+                    label_index[node.get('id')] = label
+        return groups
+    return prepare
+
+def _edge_preparer(label_index, element_ids=None):
+    """Returns prepare(batch) for edge batches."""
+    if label_index is None:
+        label_index = {}
+    return lambda batch: group_edges(batch, label_index, element_ids)
 
-def create_constraints(driver, db_name):
-     # (No changes needed here - keeping the previous version)
-    print("Skipping automatic constraint creation (using MERGE on 'id' for uniqueness). "
-          "Consider adding constraints manually if needed.", file=sys.stderr)
+def _element_id_recorder(element_ids):
+    """Returns an on_commit hook storing committed (id, elementId) pairs and returning their count."""
+    def record(pairs):
+        element_ids.update(pairs)
+        return len(pairs)
+    return record
 
-# --- MODIFIED insert_nodes ---
-def insert_nodes(driver, db_name, nodes_data, batch_size):
-    """Inserts or updates nodes in Neo4j using UNWIND in batches with progress."""
-    if not nodes_data:
+def _record_phase(metrics, processed_count, sent_count, started):
+    if metrics is not None:
+        metrics.rows += processed_count
+        metrics.sent += sent_count
+        metrics.seconds += time.perf_counter() - started
+
+def _report_nodes(processed_count, sent_count):
+    if sent_count == 0:
+        print("\nNo node data to insert.", file=sys.stderr)
+    elif processed_count != sent_count:
+        print(f"\nWarning: Processed node count ({processed_count}) doesn't match total nodes ({sent_count}). Check results.", file=sys.stderr)
+    else:
+        print(f"\nProcessed {processed_count} nodes successfully.", file=sys.stderr)
+
+def _report_edges(processed_count, sent_count):
+    if sent_count == 0:
+        print("\nNo edge data to insert.", file=sys.stderr)
+    elif processed_count != sent_count:
+        print(f"\nWarning: Created edge count ({processed_count}) doesn't match total edges ({sent_count}). "
+              "Check results; edges with missing endpoints are only reported without --skip-validation.",
+              file=sys.stderr)
+    else:
+        print(f"\nCreated {processed_count} relationships successfully.", file=sys.stderr)
+
+def insert_nodes(sink, nodes_data, batch_size, label_index=None,
+                 workers=1, max_retries=DEFAULT_MAX_RETRIES, progress=None, rejects=None,
+                 element_ids=None, metrics=None):
+    """Inserts or updates nodes in the sink (Neo4j: UNWIND in batches) with progress.
+
+    nodes_data may be a list or any iterable (e.g. a streaming parser); it is
+    consumed batch by batch, so only one batch is held in memory at a time.
+    Each batch is grouped by node type and merged with a per-label query.
+    If label_index is given, it is filled with id -> label for insert_edges.
+    With workers > 1, nodes are partitioned by id across concurrent sessions.
+    With a PhaseProgress, committed batches are skipped and new ones recorded.
+    With a RejectLog, nodes the server refuses are logged and skipped.
+    If element_ids (an ElementIdCache) is given, it is filled with the
+    elementId of every committed node so insert_edges can skip index lookups.
+    With a PhaseMetrics, batch latencies, retries, rejects and totals are recorded.
+    Returns the number of nodes the sink reported as written.
+    """
+    if progress is not None and progress.complete:
+        print("Nodes already imported according to the checkpoint; skipping.", file=sys.stderr)
+        return 0
+    total_nodes = _record_count(nodes_data)
+    sizer = as_batch_sizer(batch_size)
+    if total_nodes == 0:
         print("No node data to insert.", file=sys.stderr)
-        return
+        return 0
 
-    total_nodes = len(nodes_data)
-    print(f"Inserting/Updating {total_nodes} nodes in batches of {batch_size}...", file=sys.stderr)
+    if total_nodes is None:
+        print(f"Streaming nodes in {sizer.describe()}...", file=sys.stderr)
+    else:
+        print(f"Inserting/Updating {total_nodes} nodes in {sizer.describe()}...", file=sys.stderr)
+    if workers > 1:
+        print(f"Using {workers} parallel writer sessions.", file=sys.stderr)
 
-    # Cypher query remains the same, but will be executed per batch
-    query = """
-    UNWIND $batch as node_data
-    MERGE (n {id: node_data.id})
-    SET n = node_data // Overwrite/set all properties from the map
-    WITH n, node_data
-    CALL apoc.create.addLabels(n, [apoc.text.capitalize(node_data.type)]) YIELD node
-    RETURN count(node) as processed_nodes_count
+    try:
+        started = time.perf_counter()
+        with tqdm(total=total_nodes, desc="Processing Nodes", unit="node", file=sys.stdout) as pbar:
+            processed_count, sent_count = _write_records(
+                sink, nodes_data, sizer, _node_preparer(label_index),
+                sink.write_nodes if element_ids is None else sink.write_nodes_with_ids, pbar,
+                workers=workers, partition_key=lambda node: node.get('id'), max_retries=max_retries,
+                progress=progress, rejects=rejects, kind="node",
+                on_commit=None if element_ids is None else _element_id_recorder(element_ids), metrics=metrics)
+        _record_phase(metrics, processed_count, sent_count, started)
+        _report_nodes(processed_count, sent_count)
+        if sizer.adaptive:
+            print(f"Adaptive node batch size ended at {sizer.rows} rows.", file=sys.stderr)
+        if progress is not None:
+            progress.finish()
+        return processed_count
+
+    except Exception as e:
+        print(f"\nError inserting nodes: {e}", file=sys.stderr)
+        raise
+
+def insert_edges(sink, edges_data, batch_size, label_index=None,
+                 workers=1, max_retries=DEFAULT_MAX_RETRIES, progress=None, rejects=None,
+                 element_ids=None, metrics=None):
+    """Inserts relationships in batches with progress.
+
+    Like insert_nodes, edges_data may be any iterable and is consumed lazily.
+    Each batch is grouped by relationship type and endpoint labels, and every
+    group is written with a static CREATE whose MATCH clauses hit label+id indexes.
+    With workers > 1, edges are partitioned by source id across concurrent
+    sessions, so no two sessions ever lock the same source node. Edges whose
+    endpoints are both in element_ids are matched by element id directly.
+    Returns the number of relationships the sink reported as created.
     """
-    processed_count = 0
+    if progress is not None and progress.complete:
+        print("Edges already imported according to the checkpoint; skipping.", file=sys.stderr)
+        return 0
+    total_edges = _record_count(edges_data)
+    sizer = as_batch_sizer(batch_size)
+    if total_edges == 0:
+        print("No edge data to insert.", file=sys.stderr)
+        return 0
+
+    if total_edges is None:
+        print(f"Streaming relationships in {sizer.describe()}...", file=sys.stderr)
+    else:
+        print(f"Inserting {total_edges} relationships in {sizer.describe()}...", file=sys.stderr)
+    if workers > 1:
+        print(f"Using {workers} parallel writer sessions.", file=sys.stderr)
+
     try:
-        with driver.session(database=db_name) as session:
-            # Use tqdm to iterate over batches
-            num_batches = (total_nodes + batch_size - 1) // batch_size
-            with tqdm(total=total_nodes, desc="Processing Nodes", unit="node", file=sys.stdout) as pbar:
-                 for i in range(0, total_nodes, batch_size):
-                    batch = nodes_data[i:min(i + batch_size, total_nodes)]
-                    if not batch: continue # Should not happen with correct range, but safety check
-
-                    # Use execute_write for transactional safety per batch
-                    result = session.execute_write(lambda tx: tx.run(query, batch=batch).single())
-                    count_in_batch = result["processed_nodes_count"] if result else 0
-                    processed_count += count_in_batch
-                    pbar.update(len(batch)) # Update progress bar by number of items in batch
-
-        # Final summary check (optional)
-        if processed_count != total_nodes:
-             print(f"\nWarning: Processed node count ({processed_count}) doesn't match total nodes ({total_nodes}). Check results.", file=sys.stderr)
-        else:
-            print(f"\nProcessed {processed_count} nodes successfully.", file=sys.stderr)
+        started = time.perf_counter()
+        with tqdm(total=total_edges, desc="Processing Edges", unit="edge", file=sys.stdout) as pbar:
+            processed_count, sent_count = _write_records(
+                sink, edges_data, sizer, _edge_preparer(label_index, element_ids), sink.write_edges, pbar,
+                workers=workers, partition_key=lambda edge: edge.get('sourceId'), max_retries=max_retries,
+                progress=progress, rejects=rejects, kind="edge", metrics=metrics)
+        _record_phase(metrics, processed_count, sent_count, started)
+        _report_edges(processed_count, sent_count)
+        if sizer.adaptive:
+            print(f"Adaptive edge batch size ended at {sizer.rows} rows.", file=sys.stderr)
+        if progress is not None:
+            progress.finish()
+        return processed_count
+
+    except Exception as e:
+        print(f"\nError inserting edges: {e}", file=sys.stderr)
+        print("Ensure source/target nodes exist.", file=sys.stderr)
+        raise
+
+# --- Async Import ---
+
+async def _async_write_node_batch(tx, groups):
+    """Async twin of _write_node_batch."""
+    count = 0
+    for label, rows in groups.items():
+        result = await tx.run(node_merge_query(label), batch=rows)
+        record = await result.single()
+        count += record["processed_nodes_count"] if record else 0
+    return count
+
+async def _async_write_node_batch_with_ids(tx, groups):
+    """Async twin of _write_node_batch_with_ids."""
+    pairs = []
+    for label, rows in groups.items():
+        result = await tx.run(node_merge_query(label, return_element_ids=True), batch=rows)
+        pairs.extend([(record["id"], record["element_id"]) async for record in result])
+    return pairs
+
+async def _async_write_edge_batch(tx, groups):
+    """Async twin of _write_edge_batch."""
+    count = 0
+    for (edge_type, source_label, target_label), rows in groups.items():
+        result = await tx.run(edge_create_query(edge_type, source_label, target_label), batch=rows)
+        record = await result.single()
+        count += record["created_edge_count"] if record else 0
+    return count
+
+async def async_write_with_retry(session, work, payload, max_retries=DEFAULT_MAX_RETRIES, metrics=None):
+    """Async twin of write_with_retry."""
+    for attempt in range(max_retries + 1):
+        try:
+            return await session.execute_write(work, payload)
+        except Exception as e:
+            if attempt == max_retries or classify_error(e) != 'transient':
+                raise
+            delay = _retry_delay(attempt)
+            print(f"\nTransient error ({type(e).__name__}), retrying in {delay:.1f}s "
+                  f"(attempt {attempt + 1}/{max_retries}): {e}", file=sys.stderr)
+            if metrics is not None:
+                metrics.retry()
+            await asyncio.sleep(delay)
+
+async def async_commit_batch(session, work, prepare, batch, max_retries=DEFAULT_MAX_RETRIES,
+                             rejects=None, kind="record", payload=None, sizer=None, on_commit=None,
+                             metrics=None):
+    """Async twin of commit_batch."""
+    try:
+        result = await async_write_with_retry(
+            session, work, prepare(batch) if payload is None else payload, max_retries, metrics)
+        return on_commit(result) if on_commit is not None else result
+    except Exception as e:
+        error_class = classify_error(e)
+        if error_class == 'oversize' and sizer is not None:
+            sizer.shrink()
+        if rejects is None or error_class not in ('data', 'oversize'):
+            raise
+        if len(batch) == 1:
+            rejects.add(kind, batch[0], e)
+            if metrics is not None:
+                metrics.reject()
+            return 0
+    mid = len(batch) // 2
+    return (await async_commit_batch(session, work, prepare, batch[:mid], max_retries, rejects, kind,
+                                     sizer=sizer, on_commit=on_commit, metrics=metrics)
+            + await async_commit_batch(session, work, prepare, batch[mid:], max_retries, rejects, kind,
+                                       sizer=sizer, on_commit=on_commit, metrics=metrics))
+
+async def _async_write_records(driver, db_name, records, batch_size, prepare, work, pbar,
+                               max_inflight=DEFAULT_MAX_INFLIGHT, max_retries=DEFAULT_MAX_RETRIES,
+                               progress=None, rejects=None, kind="record", on_commit=None, metrics=None):
+    """Pipelines batches through up to max_inflight concurrent transactions.
+
+    Reading the next batch (JSON parsing in --stream mode) and building its
+    parameters run in a worker thread, so they overlap with the transactions
+    already in flight instead of waiting for each round trip. Batches may
+    commit out of order; progress keeps track of the gaps.
+    Returns (processed_count, sent_count).
+    """
+    sizer = as_batch_sizer(batch_size)
+    batches = index_batches(records, sizer, progress)
 
+    def next_payload():
+        item = next(batches, None)
+        if item is None:
+            return None
+        batch, start, end = item
+        return batch, prepare(batch), start, end
+
+    semaphore = asyncio.Semaphore(max_inflight)
+    pending = set()
+    errors = []
+    counts = {'processed': 0, 'sent': 0}
+
+    async def commit(batch, payload, start, end):
+        try:
+            async with driver.session(database=db_name) as session:
+                started = time.perf_counter()
+                count = await async_commit_batch(session, work, prepare, batch, max_retries,
+                                                 rejects, kind, payload, sizer, on_commit, metrics)
+                elapsed = time.perf_counter() - started
+                sizer.observe(len(batch), elapsed)
+                if metrics is not None:
+                    metrics.observe_batch(elapsed)
+            if progress is not None:
+                progress.mark(0, start, end)
+            # Add after the await: `counts[...] += await ...` would read the total before suspending
+            counts['processed'] += count
+            pbar.update(len(batch))
+        except Exception as e:
+            errors.append(e)
+        finally:
+            semaphore.release()
+
+    try:
+        while not errors:
+            await semaphore.acquire()
+            item = await asyncio.to_thread(next_payload)
+            if item is None:
+                semaphore.release()
+                break
+            batch, payload, start, end = item
+            counts['sent'] += len(batch)
+            task = asyncio.create_task(commit(batch, payload, start, end))
+            pending.add(task)
+            task.add_done_callback(pending.discard)
+        await asyncio.gather(*pending)
+    finally:
+        for task in pending:
+            task.cancel()
+    if errors:
+        raise errors[0]
+    return counts['processed'], counts['sent']
+
+async def insert_nodes_async(driver, db_name, nodes_data, batch_size, label_index=None,
+                             max_inflight=DEFAULT_MAX_INFLIGHT, max_retries=DEFAULT_MAX_RETRIES,
+                             progress=None, rejects=None, element_ids=None, metrics=None):
+    """Async counterpart of insert_nodes using an AsyncDriver."""
+    if progress is not None and progress.complete:
+        print("Nodes already imported according to the checkpoint; skipping.", file=sys.stderr)
+        return 0
+    total_nodes = _record_count(nodes_data)
+    sizer = as_batch_sizer(batch_size)
+    if total_nodes == 0:
+        print("No node data to insert.", file=sys.stderr)
+        return 0
+    print(f"Inserting/Updating nodes in {sizer.describe()} "
+          f"with up to {max_inflight} transactions in flight...", file=sys.stderr)
+    try:
+        started = time.perf_counter()
+        with tqdm(total=total_nodes, desc="Processing Nodes", unit="node", file=sys.stdout) as pbar:
+            processed_count, sent_count = await _async_write_records(
+                driver, db_name, nodes_data, sizer, _node_preparer(label_index),
+                _async_write_node_batch if element_ids is None else _async_write_node_batch_with_ids,
+                pbar, max_inflight, max_retries, progress, rejects, "node",
+                None if element_ids is None else _element_id_recorder(element_ids), metrics)
+        _record_phase(metrics, processed_count, sent_count, started)
+        _report_nodes(processed_count, sent_count)
+        if sizer.adaptive:
+            print(f"Adaptive node batch size ended at {sizer.rows} rows.", file=sys.stderr)
+        if progress is not None:
+            progress.finish()
+        return processed_count
     except Exception as e:
-        print(f"\nError inserting nodes (around item {processed_count}): {e}", file=sys.stderr)
-        print("Ensure APOC plugin is installed in Neo4j if using dynamic labels.", file=sys.stderr)
+        print(f"\nError inserting nodes: {e}", file=sys.stderr)
         raise
 
-# --- MODIFIED insert_edges ---
-def insert_edges(driver, db_name, edges_data, batch_size):
-    """Inserts relationships in batches with progress."""
-    if not edges_data:
+async def insert_edges_async(driver, db_name, edges_data, batch_size, label_index=None,
+                             max_inflight=DEFAULT_MAX_INFLIGHT, max_retries=DEFAULT_MAX_RETRIES,
+                             progress=None, rejects=None, element_ids=None, metrics=None):
+    """Async counterpart of insert_edges using an AsyncDriver."""
+    if progress is not None and progress.complete:
+        print("Edges already imported according to the checkpoint; skipping.", file=sys.stderr)
+        return 0
+    total_edges = _record_count(edges_data)
+    sizer = as_batch_sizer(batch_size)
+    if total_edges == 0:
         print("No edge data to insert.", file=sys.stderr)
-        return
+        return 0
+    print(f"Inserting relationships in {sizer.describe()} "
+          f"with up to {max_inflight} transactions in flight...", file=sys.stderr)
+    try:
+        started = time.perf_counter()
+        with tqdm(total=total_edges, desc="Processing Edges", unit="edge", file=sys.stdout) as pbar:
+            processed_count, sent_count = await _async_write_records(
+                driver, db_name, edges_data, sizer, _edge_preparer(label_index, element_ids),
+                _async_write_edge_batch, pbar, max_inflight, max_retries, progress,
+                rejects, "edge", metrics=metrics)
+        _record_phase(metrics, processed_count, sent_count, started)
+        _report_edges(processed_count, sent_count)
+        if sizer.adaptive:
+            print(f"Adaptive edge batch size ended at {sizer.rows} rows.", file=sys.stderr)
+        if progress is not None:
+            progress.finish()
+        return processed_count
+    except Exception as e:
+        print(f"\nError inserting edges: {e}", file=sys.stderr)
+        print("Ensure source/target nodes exist.", file=sys.stderr)
+        raise
+
+async def import_graph_async(uri, auth, db_name, nodes, edges, batch_size, label_index=None,
+                             max_inflight=DEFAULT_MAX_INFLIGHT, max_retries=DEFAULT_MAX_RETRIES,
+                             checkpoint=None, rejects=None, edge_batch_size=None, element_ids=None,
+                             metrics=None):
+    """Opens an AsyncDriver and writes all nodes, then all edges.
+
+    edge_batch_size defaults to batch_size; pass separate sizers when batching adaptively.
+    metrics (an ImportMetrics) receives the 'nodes' and 'edges' phases. Returns the (node, edge) counts reported by the server.
+    """
+    driver = AsyncGraphDatabase.driver(uri, auth=auth)
+    try:
+        await driver.verify_connectivity()
+        node_count = await insert_nodes_async(driver, db_name, nodes, batch_size, label_index, max_inflight,
+                                              max_retries, checkpoint.phase('nodes') if checkpoint else None,
+                                              rejects, element_ids,
+                                              metrics.phase('nodes') if metrics else None)
+        edge_count = await insert_edges_async(driver, db_name, edges, edge_batch_size or batch_size, label_index,
+                                              max_inflight, max_retries,
+                                              checkpoint.phase('edges') if checkpoint else None, rejects,
+                                              element_ids, metrics.phase('edges') if metrics else None)
+    finally:
+        await driver.close()
+    return node_count, edge_count
+
+# --- Incremental Import ---
+
+SNAPSHOT_SCHEMA = """
+CREATE TABLE IF NOT EXISTS nodes (id PRIMARY KEY, digest BLOB NOT NULL, label TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS edges (digest BLOB PRIMARY KEY, source, target, type TEXT NOT NULL, count INTEGER NOT NULL,
+                                  properties TEXT);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TEMP TABLE new_nodes (id PRIMARY KEY, digest BLOB NOT NULL, label TEXT NOT NULL);
+CREATE TEMP TABLE new_edges (digest BLOB PRIMARY KEY, source, target, type TEXT NOT NULL, count INTEGER NOT NULL,
+                             properties TEXT);
+CREATE TEMP TABLE dropped_nodes (id PRIMARY KEY);
+"""
+
+# Rows inserted into the snapshot per executemany call
+SNAPSHOT_CHUNK_SIZE = 10000
+
+def record_digest(record):
+    """Returns a stable 16-byte content hash of a node or edge record."""
+    return hashlib.blake2b(_canonical_json(record).encode('utf-8'), digest_size=16).digest()
+
+
+class ImportDelta:
+    """What an incremental run has to change, as computed by SnapshotStore.diff.
+
+    When full is True there is nothing to compare against and every record is
+    written. Otherwise only the changed node ids and the added edge digests
+    (with how many copies to add) are kept in memory.
+    """
+
+    def __init__(self, full, changed_node_ids=None, edge_additions=None,
+                 dropped_node_ids=None, removed_edges=None):
+        self.full = full
+        self.changed_node_ids = changed_node_ids or set()
+        self.edge_additions = edge_additions or {}
+        self.dropped_node_ids = dropped_node_ids or []
+        self.removed_edges = removed_edges or []
+
+    def filter_nodes(self, nodes_data):
+        if self.full:
+            return nodes_data
+        return (node for node in nodes_data if node.get('id') in self.changed_node_ids)
+
+    def filter_edges(self, edges_data):
+        if self.full:
+            return edges_data
+        remaining = dict(self.edge_additions)
+
+        def added_edges():
+            for edge in edges_data:
+                digest = record_digest(edge)
+                if remaining.get(digest, 0) > 0:
+                    remaining[digest] -= 1
+                    yield edge
+        return added_edges()
+
+
+class SnapshotStore:
+    """Local SQLite record of what the last successful import wrote.
+
+    Holds one content digest per node id and per distinct edge record (with
+    its multiplicity and relationship properties), so the next run can diff
+    the new input against it on disk instead of in memory. The new state is
+    staged in temporary tables and only replaces the snapshot in commit(),
+    after the import succeeded.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._conn = sqlite3.connect(path)
+        self._conn.executescript(SNAPSHOT_SCHEMA)
+        # Snapshots written before edge properties were recorded: their removed
+        # edges (NULL properties) are matched by endpoints and type only
+        columns = [row[1] for row in self._conn.execute("PRAGMA main.table_info(edges)")]
+        if 'properties' not in columns:
+            self._conn.execute("ALTER TABLE edges ADD COLUMN properties TEXT")
+
+    def close(self):
+        self._conn.close()
+
+    @property
+    def generation(self):
+        """Token that changes with every commit(); ties an incremental checkpoint to this snapshot state."""
+        row = self._conn.execute("SELECT value FROM meta WHERE key = 'generation'").fetchone()
+        return row[0] if row else "initial"
+
+    def _stage(self, nodes_data, edges_data):
+        conn = self._conn
+        for batch in batched(nodes_data, SNAPSHOT_CHUNK_SIZE):
+            # Later duplicates win, like the SET n = node_data of the MERGE
+            conn.executemany(
+                "INSERT OR REPLACE INTO new_nodes VALUES (?, ?, ?)",
+                [(node.get('id'), record_digest(node), node_label(node.get('type'))) for node in batch])
+        for batch in batched(edges_data, SNAPSHOT_CHUNK_SIZE):
+            conn.executemany(
+                "INSERT INTO new_edges VALUES (?, ?, ?, ?, 1, ?) "
+                "ON CONFLICT(digest) DO UPDATE SET count = count + 1",
+                [(record_digest(edge), edge.get('sourceId'), edge.get('targetId'), rel_type(edge.get('type')),
+                  _canonical_json(stored_edge_properties(edge)))
+                 for edge in batch])
+
+    def diff(self, nodes_data, edges_data, reset=False):
+        """Stages the new input and returns the ImportDelta against the snapshot.
+
+        With reset=True (the database was cleared) the snapshot is ignored and
+        the delta is a full import.
+        """
+        print(f"Hashing input and comparing with snapshot '{self.path}'...", file=sys.stderr)
+        self._stage(nodes_data, edges_data)
+        conn = self._conn
+        if reset or conn.execute("SELECT NOT EXISTS (SELECT 1 FROM nodes)").fetchone()[0]:
+            return ImportDelta(full=True)
+
+        changed = {row[0] for row in conn.execute(
+            "SELECT n.id FROM new_nodes n LEFT JOIN nodes o ON o.id = n.id "
+            "WHERE o.id IS NULL OR o.digest != n.digest")}
+        # Removed nodes and nodes whose label changed are deleted with their relationships;
+        # relabelled nodes (and all of their edges) are then written again from scratch
+        conn.execute(
+            "INSERT INTO dropped_nodes SELECT o.id FROM nodes o LEFT JOIN new_nodes n ON n.id = o.id "
+            "WHERE n.id IS NULL OR n.label != o.label")
+        # Deletions are ordered, so a rerun after a failure sees the same batches
+        dropped = [row[0] for row in conn.execute("SELECT id FROM dropped_nodes ORDER BY id")]
+        additions = dict(conn.execute(
+            "SELECT digest, add_count FROM ("
+            "  SELECT n.digest, n.count - CASE WHEN d1.id IS NULL AND d2.id IS NULL "
+            "    THEN COALESCE(o.count, 0) ELSE 0 END AS add_count"
+            "  FROM new_edges n LEFT JOIN edges o ON o.digest = n.digest"
+            "  LEFT JOIN dropped_nodes d1 ON d1.id = n.source"
+            "  LEFT JOIN dropped_nodes d2 ON d2.id = n.target"
+            ") WHERE add_count > 0"))
+        # Parallel relationships (e.g. calls from several lines) differ in their
+        # properties, so removed ones are matched by their properties too
+        removed = [
+            {'sourceId': source, 'targetId': target, 'type': edge_type,
+             'properties': json.loads(properties) if properties is not None else None, 'count': count}
+            for source, target, edge_type, properties, count in conn.execute(
+                "SELECT o.source, o.target, o.type, o.properties, SUM(o.count - COALESCE(n.count, 0)) "
+                "FROM edges o LEFT JOIN new_edges n ON n.digest = o.digest "
+                "WHERE o.count > COALESCE(n.count, 0) "
+                "AND o.source NOT IN (SELECT id FROM dropped_nodes) "
+                "AND o.target NOT IN (SELECT id FROM dropped_nodes) "
+                "GROUP BY o.source, o.target, o.type, o.properties "
+                "ORDER BY o.source, o.target, o.type, o.properties")
+        ]
+        return ImportDelta(False, changed, additions, dropped, removed)
 
-    total_edges = len(edges_data)
-    print(f"Inserting {total_edges} relationships in batches of {batch_size}...", file=sys.stderr)
+    def commit(self):
+        """Replaces the snapshot with the staged input; call only after a successful import."""
+        with self._conn:
+            self._conn.execute("DELETE FROM nodes")
+            self._conn.execute("INSERT INTO nodes SELECT * FROM new_nodes")
+            self._conn.execute("DELETE FROM edges")
+            self._conn.execute("INSERT INTO edges SELECT * FROM new_edges")
+            self._conn.execute("INSERT OR REPLACE INTO meta VALUES ('generation', ?)", (os.urandom(8).hex(),))
 
-    query = """
+
+_edge_delete_query_cache = {}
+
+def edge_delete_query(edge_type):
+    """Builds (and caches) the query deleting up to row.count relationships of one type per row.
+
+    Only relationships whose properties equal row.properties are deleted
+    (any of them when it is null, for snapshots without edge properties).
+    """
+    query = _edge_delete_query_cache.get(edge_type)
+    if query is None:
+        query = f"""
     UNWIND $batch as edge_data
-    MATCH (source {id: edge_data.sourceId})
-    MATCH (target {id: edge_data.targetId})
-    CALL apoc.create.relationship(source, apoc.text.toUpperCase(edge_data.type), {}, target) YIELD rel
-    RETURN count(rel) as created_edge_count
+    MATCH (source:{quote_name(LOOKUP_LABEL)} {{id: edge_data.sourceId}})
+          -[r:{quote_name(edge_type)}]->(target:{quote_name(LOOKUP_LABEL)} {{id: edge_data.targetId}})
+    WHERE edge_data.properties IS NULL OR properties(r) = edge_data.properties
+    WITH edge_data, collect(r)[..edge_data.count] as rels
+    FOREACH (r IN rels | DELETE r)
+    RETURN sum(size(rels)) as deleted_edge_count
+    """
+        _edge_delete_query_cache[edge_type] = query
+    return query
+
+DELETE_NODES_QUERY = f"""
+    UNWIND $batch as node_id
+    MATCH (n:{quote_name(LOOKUP_LABEL)} {{id: node_id}})
+    DETACH DELETE n
+    RETURN count(*) as deleted_node_count
+    """
+
+def _delete_edge_batch(tx, groups):
+    count = 0
+    for edge_type, rows in groups.items():
+        result = tx.run(edge_delete_query(edge_type), batch=rows).single()
+        if result and result["deleted_edge_count"]:
+            count += result["deleted_edge_count"]
+    return count
+
+def _delete_node_batch(tx, node_ids):
+    result = tx.run(DELETE_NODES_QUERY, batch=node_ids).single()
+    return result["deleted_node_count"] if result else 0
+
+def apply_deletions(sink, delta, batch_size, max_retries=DEFAULT_MAX_RETRIES, progress=None):
+    """Deletes the relationships and nodes that disappeared since the snapshot.
+
+    Runs before any inserts: relationships first, then nodes (with whatever
+    relationships are still attached to them). With a PhaseProgress, batches
+    deleted by an earlier, failed run are skipped; deleting `count` copies
+    again would remove relationships that must stay.
+    """
+    deleted_edges = deleted_nodes = 0
+    with sink.session() as session:
+        for batch, start, end in index_batches(delta.removed_edges, batch_size, progress, partition=0):
+            groups = {}
+            for row in batch:
+                row = dict(row)
+                groups.setdefault(row.pop('type'), []).append(row)
+            deleted_edges += write_with_retry(session, sink.delete_edges, groups, max_retries)
+            if progress is not None:
+                progress.mark(0, start, end)
+        for batch, start, end in index_batches(delta.dropped_node_ids, batch_size, progress, partition=1):
+            deleted_nodes += write_with_retry(session, sink.delete_nodes, batch, max_retries)
+            if progress is not None:
+                progress.mark(1, start, end)
+    print(f"Deleted {deleted_edges} stale relationships and {deleted_nodes} stale nodes.", file=sys.stderr)
+
+# --- Query Profiling ---
+
+# Operators that read every node or relationship of a label/type (or of the
+# whole graph) instead of seeking through an index
+SCAN_OPERATORS = {
+    "AllNodesScan", "NodeByLabelScan", "NodeIndexScan", "NodeUniqueIndexScan",
+    "DirectedAllRelationshipsScan", "UndirectedAllRelationshipsScan",
+    "DirectedRelationshipTypeScan", "UndirectedRelationshipTypeScan",
+}
+
+def flatten_plan(plan, depth=0):
+    """Flattens a profiled plan tree into one entry per operator, parents first."""
+    operator = plan.get('operatorType', '')
+    args = plan.get('args', {})
+    entry = {
+        'depth': depth,
+        'operator': operator.split('@')[0],
+        'details': args.get('Details'),
+        'rows': plan.get('rows'),
+        'db_hits': plan.get('dbHits'),
+        'estimated_rows': args.get('EstimatedRows'),
+    }
+    entries = [entry]
+    for child in plan.get('children', []):
+        entries.extend(flatten_plan(child, depth + 1))
+    return entries
+
+
+class BufferedResult:
+    """Already fetched records of a profiled query, with the Result methods the batch writers use."""
+
+    def __init__(self, records):
+        self._records = records
+
+    def __iter__(self):
+        return iter(self._records)
+
+    def single(self):
+        return self._records[0] if self._records else None
+
+
+class QueryProfiler:
+    """Runs the first execution of every distinct query under PROFILE and keeps its plan.
+
+    Shapes are keyed by query text, so each label's MERGE and each (type,
+    source label, target label) CREATE is profiled once, on real data. A plan
+    containing a scan operator is reported right away, since it means an
+    index is missing or not used and the import will slow down as it grows.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.plans = []
+        self.scan_warnings = 0
+        self._claimed = set()
+        self._lock = threading.Lock()
+
+    def _claim(self, query):
+        with self._lock:
+            if query in self._claimed:
+                return False
+            self._claimed.add(query)
+            return True
+
+    def run(self, tx, query, **params):
+        if not self._claim(query):
+            return tx.run(query, **params)
+        try:
+            result = tx.run("PROFILE " + query, **params)
+            records = list(result)
+            summary = result.consume()
+        except Exception:
+            with self._lock:
+                self._claimed.discard(query)  # Profile it again on the retry
+            raise
+        self.record(query, params, summary.profile or {})
+        return BufferedResult(records)
+
+    def record(self, query, params, plan):
+        operators = flatten_plan(plan)
+        scans = sorted({op['operator'] for op in operators if op['operator'] in SCAN_OPERATORS})
+        batch = params.get('batch')
+        entry = {
+            'query': " ".join(re.sub(r'//[^\n]*', '', query).split()),
+            'batch_rows': len(batch) if isinstance(batch, list) else None,
+            'db_hits': sum(op['db_hits'] or 0 for op in operators),
+            'scans': scans,
+            'operators': operators,
+        }
+        with self._lock:
+            self.plans.append(entry)
+            if scans:
+                self.scan_warnings += 1
+        if scans:
+            print(f"\nWarning: {', '.join(scans)} in the plan of: {entry['query']}\n"
+                  "Check that the unique id constraints (and their indexes) exist and are ONLINE.",
+                  file=sys.stderr)
+
+    def save(self):
+        with open(self.path, 'w', encoding='utf-8') as f:
+            json.dump({'plans': self.plans}, f, indent=2, default=str)
+        print(f"Saved {len(self.plans)} query plans to '{self.path}'"
+              + (f"; {self.scan_warnings} contain scans." if self.scan_warnings else "; no scans found."),
+              file=sys.stderr)
+
+
+class ProfilingTransaction:
+    """Transaction wrapper that sends run() through a QueryProfiler."""
+
+    def __init__(self, tx, profiler):
+        self._tx = tx
+        self._profiler = profiler
+
+    def run(self, query, **params):
+        return self._profiler.run(self._tx, query, **params)
+
+
+class ProfilingSession:
+    """Session wrapper whose write transactions are ProfilingTransactions."""
+
+    def __init__(self, session, profiler):
+        self._session = session
+        self._profiler = profiler
+
+    def __enter__(self):
+        self._session.__enter__()
+        return self
+
+    def __exit__(self, *exc_info):
+        return self._session.__exit__(*exc_info)
+
+    def execute_write(self, work, payload):
+        profiler = self._profiler
+        return self._session.execute_write(
+            lambda tx, payload: work(ProfilingTransaction(tx, profiler), payload), payload)
+
+# --- Sinks ---
+#
+# A sink is where insert_nodes/insert_edges write to. Every sink offers
+# session(), a context manager whose execute_write(work, payload) runs one
+# transaction, and the work functions for its own sessions: write_nodes,
+# write_nodes_with_ids, write_edges, delete_edges and delete_nodes. The
+# batching, retry, checkpoint and reject logic above only ever talks to
+# that interface.
+
+class Neo4jSink:
+    """Writes to a Neo4j database through the Bolt driver."""
+
+    supports_constraints = True
+    supports_element_ids = True
+    write_nodes = staticmethod(_write_node_batch)
+    write_nodes_with_ids = staticmethod(_write_node_batch_with_ids)
+    write_edges = staticmethod(_write_edge_batch)
+    delete_edges = staticmethod(_delete_edge_batch)
+    delete_nodes = staticmethod(_delete_node_batch)
+
+    def __init__(self, driver, db_name, profiler=None):
+        self.driver = driver
+        self.db_name = db_name
+        self.profiler = profiler
+
+    @classmethod
+    def connect(cls, uri, auth, db_name, profiler=None):
+        print(f"Connecting to Neo4j at {uri}...", file=sys.stderr)
+        driver = GraphDatabase.driver(uri, auth=auth)
+        try:
+            driver.verify_connectivity()
+        except Exception:
+            driver.close()
+            raise
+        print("Neo4j connection successful.", file=sys.stderr)
+        return cls(driver, db_name, profiler)
+
+    def session(self):
+        session = self.driver.session(database=self.db_name)
+        return session if self.profiler is None else ProfilingSession(session, self.profiler)
+
+    def clear(self, batch_size=DEFAULT_CLEAR_BATCH_SIZE):
+        clear_database(self.driver, self.db_name, batch_size)
+
+    def recreate(self):
+        recreate_database(self.driver, self.db_name)
+
+    def create_constraints(self, labels, index_timeout=DEFAULT_INDEX_TIMEOUT):
+        create_constraints(self.driver, self.db_name, labels, index_timeout)
+
+    def close(self):
+        if self.profiler is not None:
+            self.profiler.save()
+        self.driver.close()
+        print("Neo4j connection closed.", file=sys.stderr)
+
+
+class LocalSession:
+    """Session of an in-process sink: every transaction holds the sink's lock."""
+
+    def __init__(self, sink):
+        self._sink = sink
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def execute_write(self, work, payload):
+        with self._sink.lock:
+            return work(self._sink, payload)
+
+
+class MemoryGraphSink:
+    """In-memory reference graph with the same write semantics as the Neo4j queries.
+
+    Nodes are merged by id (a node cannot change its label, like under the
+    CodeElement constraint), edge endpoints must exist with the grouped label,
+    and properties replace the previous ones. Lets the whole pipeline run and
+    be profiled without a server.
+    """
+
+    supports_constraints = False
+    supports_element_ids = False
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.nodes = {}  # id -> (label, properties)
+        self.edges = []  # (source id, type, target id, properties)
+
+    def session(self):
+        return LocalSession(self)
+
+    def clear(self, batch_size=DEFAULT_CLEAR_BATCH_SIZE):
+        self.nodes.clear()
+        self.edges.clear()
+
+    def recreate(self):
+        self.clear()
+
+    def close(self):
+        print(f"In-memory graph holds {len(self.nodes)} nodes and {len(self.edges)} relationships.",
+              file=sys.stderr)
+
+    def _has_node(self, node_id, label):
+        entry = self.nodes.get(node_id)
+        return entry is not None and (label == LOOKUP_LABEL or entry[0] == label)
+
+    @staticmethod
+    def write_nodes(sink, groups):
+        # Check the whole batch first so a refused batch leaves the graph untouched
+        for label, rows in groups.items():
+            for node in rows:
+                entry = sink.nodes.get(node.get('id'))
+                if entry is not None and entry[0] != label:
+                    raise ValueError(f"Node {node.get('id')!r} already exists with label {entry[0]}")
+        count = 0
+        for label, rows in groups.items():
+            for node in rows:
+                sink.nodes[node.get('id')] = (label, dict(node))
+            count += len(rows)
+        return count
+
+    @staticmethod
+    def write_edges(sink, groups):
+        count = 0
+        for (edge_type, source_label, target_label), rows in groups.items():
+            for row in rows:
+                if sink._has_node(row['sourceId'], source_label) and sink._has_node(row['targetId'], target_label):
+                    sink.edges.append((row['sourceId'], edge_type, row['targetId'],
+                                       stored_edge_properties(row['properties'])))
+                    count += 1
+        return count
+
+    @staticmethod
+    def delete_edges(sink, groups):
+        remaining = {}  # (source, type, target) -> [[properties or None, count], ...]
+        for edge_type, rows in groups.items():
+            for row in rows:
+                key = (row['sourceId'], edge_type, row['targetId'])
+                remaining.setdefault(key, []).append([row.get('properties'), row['count']])
+        kept = []
+        for edge in sink.edges:
+            for entry in remaining.get(edge[:3], ()):
+                if entry[1] > 0 and (entry[0] is None or entry[0] == edge[3]):
+                    entry[1] -= 1
+                    break
+            else:
+                kept.append(edge)
+        deleted = len(sink.edges) - len(kept)
+        sink.edges[:] = kept
+        return deleted
+
+    @staticmethod
+    def delete_nodes(sink, node_ids):
+        dropped = {node_id for node_id in node_ids if node_id in sink.nodes}
+        for node_id in dropped:
+            del sink.nodes[node_id]
+        sink.edges[:] = [edge for edge in sink.edges if edge[0] not in dropped and edge[2] not in dropped]
+        return len(dropped)
+
+
+class NullSink:
+    """Accepts and counts every record without storing anything, to time the client side alone."""
+
+    supports_constraints = False
+    supports_element_ids = False
+
+    def __init__(self):
+        self.lock = threading.Lock()
+
+    def session(self):
+        return LocalSession(self)
+
+    def clear(self, batch_size=DEFAULT_CLEAR_BATCH_SIZE):
+        pass
+
+    def recreate(self):
+        pass
+
+    def close(self):
+        pass
+
+    @staticmethod
+    def write_nodes(sink, groups):
+        return sum(len(rows) for rows in groups.values())
+
+    write_edges = write_nodes
+
+    @staticmethod
+    def delete_edges(sink, groups):
+        return sum(row['count'] for rows in groups.values() for row in rows)
+
+    @staticmethod
+    def delete_nodes(sink, node_ids):
+        return len(node_ids)
+
+
+SINKS = {'neo4j': Neo4jSink, 'memory': MemoryGraphSink, 'null': NullSink}
+
+def open_sink(args, auth):
+    """Creates the sink selected with --sink."""
+    if args.sink == 'neo4j':
+        profiler = QueryProfiler(args.profile) if args.profile else None
+        return Neo4jSink.connect(args.uri, auth, args.database, profiler)
+    print(f"Writing to the '{args.sink}' sink instead of Neo4j.", file=sys.stderr)
+    return SINKS[args.sink]()
+
+# --- Offline Bulk Export ---
+
+# neo4j-admin property types for Python values; anything else is written as a JSON string
+_CSV_SCALAR_TYPES = ((bool, "boolean"), (int, "long"), (float, "double"), (str, "string"))
+CSV_ARRAY_DELIMITER = ";"
+
+def _csv_type(value):
+    """Returns the neo4j-admin header type for a value, or None when it carries no type information."""
+    if value is None:
+        return None
+    if isinstance(value, list):
+        element_types = {_csv_type(v) for v in value} - {None}
+        if not element_types:
+            return None
+        if len(element_types) == 1 and not next(iter(element_types)).endswith("[]"):
+            return next(iter(element_types)) + "[]"
+        return "string[]"
+    for py_type, csv_type in _CSV_SCALAR_TYPES:
+        if isinstance(value, py_type):
+            return csv_type
+    return "string"
+
+def _merge_csv_types(current, new):
+    if current is None or current == new:
+        return new
+    if new is None:
+        return current
+    if {current, new} == {"long", "double"}:
+        return "double"
+    # Conflicting types: fall back to strings, keeping arrays as arrays
+    return "string[]" if current.endswith("[]") and new.endswith("[]") else "string"
+
+def _csv_value(value, csv_type):
+    """Formats one property value for a column of the given header type."""
+    if value is None:
+        return ""
+    if csv_type.endswith("[]"):
+        items = value if isinstance(value, list) else [value]
+        return CSV_ARRAY_DELIMITER.join(_csv_value(v, csv_type[:-2]) for v in items)
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False)
+    return str(value)
+
+def _csv_file_stem(prefix, name, used):
+    """Returns a filesystem-safe, unique file stem for a label or relationship type."""
+    stem = f"{prefix}_{re.sub(r'[^A-Za-z0-9_]', '_', name)}"
+    candidate, n = stem, 1
+    while candidate in used:
+        n += 1
+        candidate = f"{stem}_{n}"
+    used.add(candidate)
+    return candidate
+
+def infer_node_columns(nodes_data):
+    """Scans the nodes once and returns {label: {property: neo4j-admin type}}."""
+    columns = {}
+    for node in nodes_data:
+        label_columns = columns.setdefault(node_label(node.get('type')), {})
+        for key, value in node.items():
+            if key != 'id':
+                label_columns[key] = _merge_csv_types(label_columns.get(key), _csv_type(value))
+    return columns
+
+def infer_edge_columns(edges_data):
+    """Scans the edges once and returns {relationship type: {property: neo4j-admin type}}."""
+    columns = {}
+    for edge in edges_data:
+        type_columns = columns.setdefault(rel_type(edge.get('type')), {})
+        for key, value in edge_properties(edge).items():
+            type_columns[key] = _merge_csv_types(type_columns.get(key), _csv_type(value))
+    return columns
+
+def export_admin_csv(nodes_data, edges_data, out_dir, db_name):
+    """Writes neo4j-admin import CSVs for the whole graph to out_dir.
+
+    Nodes and edges are each read twice (once to infer the property columns of
+    every label and relationship type, once to write rows), so both passes
+    stream when the input does. Each label and relationship type gets a header file and a data file.
+    Returns the neo4j-admin command that imports them.
     """
-    processed_count = 0
+    out_dir = os.path.abspath(out_dir)
+    os.makedirs(out_dir, exist_ok=True)
+    used_stems = set()
+    node_files, rel_files = [], []
+
+    print("Scanning node properties for CSV headers...", file=sys.stderr)
+    columns = infer_node_columns(nodes_data)
+
+    writers, handles = {}, []
     try:
-        with driver.session(database=db_name) as session:
+        for label, props in columns.items():
+            stem = _csv_file_stem("nodes", label, used_stems)
+            header_path = os.path.join(out_dir, f"{stem}.header.csv")
+            data_path = os.path.join(out_dir, f"{stem}.csv")
+            with open(header_path, 'w', newline='', encoding='utf-8') as f:
+                csv.writer(f).writerow(
+                    ["id:ID"] + [f"{key}:{csv_type or 'string'}" for key, csv_type in props.items()] + [":LABEL"])
+            handle = open(data_path, 'w', newline='', encoding='utf-8')
+            handles.append(handle)
+            writers[label] = (csv.writer(handle), props)
+            node_files.append((header_path, data_path))
 
-            with tqdm(total=total_edges, desc="Processing Edges", unit="edge", file=sys.stdout) as pbar:
-                for i in range(0, total_edges, batch_size):
-                    batch = edges_data[i:min(i + batch_size, total_edges)]
-                    if not batch: 
-                        continue
+        node_count = 0
+        for node in tqdm(nodes_data, desc="Exporting Nodes", unit="node", file=sys.stdout):
+            label = node_label(node.get('type'))
+            writer, props = writers[label]
+            writer.writerow(
+                [node.get('id')]
+                + [_csv_value(node.get(key), csv_type or 'string') for key, csv_type in props.items()]
+                + [f"{label}{CSV_ARRAY_DELIMITER}{LOOKUP_LABEL}"])
+            node_count += 1
 
-                    result = session.execute_write(lambda tx: tx.run(query, batch=batch).single())
-                    count_in_batch = result["created_edge_count"] if result else 0
-                    processed_count += count_in_batch
-                    pbar.update(len(batch))
+        print("Scanning relationship properties for CSV headers...", file=sys.stderr)
+        rel_columns = infer_edge_columns(edges_data)
+        rel_writers = {}
+        for edge_type, props in rel_columns.items():
+            stem = _csv_file_stem("rels", edge_type, used_stems)
+            header_path = os.path.join(out_dir, f"{stem}.header.csv")
+            data_path = os.path.join(out_dir, f"{stem}.csv")
+            with open(header_path, 'w', newline='', encoding='utf-8') as f:
+                csv.writer(f).writerow(
+                    [":START_ID"] + [f"{key}:{csv_type or 'string'}" for key, csv_type in props.items()]
+                    + [":END_ID", ":TYPE"])
+            handle = open(data_path, 'w', newline='', encoding='utf-8')
+            handles.append(handle)
+            rel_writers[edge_type] = (csv.writer(handle), props)
+            rel_files.append((header_path, data_path))
 
-        if processed_count != total_edges:
-             print(f"\nWarning: Created edge count ({processed_count}) doesn't match total edges ({total_edges}). Check results.", file=sys.stderr)
-        else:
-             print(f"\nCreated {processed_count} relationships successfully.", file=sys.stderr)
+        edge_count = 0
+        for edge in tqdm(edges_data, desc="Exporting Edges", unit="edge", file=sys.stdout):
+            edge_type = rel_type(edge.get('type'))
+            writer, props = rel_writers[edge_type]
+            writer.writerow(
+                [edge.get('sourceId')]
+                + [_csv_value(edge.get(key), csv_type or 'string') for key, csv_type in props.items()]
+                + [edge.get('targetId'), edge_type])
+            edge_count += 1
+    finally:
+        for handle in handles:
+            handle.close()
 
-    except Exception as e:
-        print(f"\nError inserting edges (around item {processed_count}): {e}", file=sys.stderr)
-        print("Ensure APOC plugin is installed and source/target nodes exist.", file=sys.stderr)
-        raise
+    command = ["neo4j-admin", "database", "import", "full", db_name,
+               "--overwrite-destination", "--multiline-fields=true",
+               f"--array-delimiter={CSV_ARRAY_DELIMITER}"]
+    command += [f"--nodes={header},{data}" for header, data in node_files]
+    command += [f"--relationships={header},{data}" for header, data in rel_files]
+    command_line = shlex.join(command)
+    script_path = os.path.join(out_dir, "neo4j-admin-import.sh")
+    with open(script_path, 'w', encoding='utf-8') as f:
+        f.write("#!/bin/sh\n# Stop the database before running a full import.\n" + command_line + "\n")
+    print(f"\nExported {node_count} nodes ({len(node_files)} labels) and {edge_count} relationships "
+          f"({len(rel_files)} types) to '{out_dir}'.", file=sys.stderr)
+    print(f"Import command written to {script_path}", file=sys.stderr)
+    return command_line
 
 # --- Main Execution ---
 
-if __name__ == "__main__":
-    print("--- Starting Neo4j Population ---", file=sys.stderr)
-    start_time = time.time()
-    args = parse_arguments()
+def run_import(args, metrics, sink=None):
+    """Runs the import described by the parsed arguments and returns the exit status.
 
-    # 1. Load JSON data (no changes needed here)
+    Stage timings and write metrics are recorded in metrics (an ImportMetrics).
+    A sink passed in is used instead of the one selected by --sink and is left
+    open, so callers such as the benchmark or tests can inspect it.
+    """
+    # 1. Load JSON data (or set up lazy readers in streaming mode)
     try:
-        print(f"Loading JSON data from: {args.input_file}", file=sys.stderr)
-        # ... (rest of JSON loading logic) ...
-        with open(args.input_file, 'r', encoding='utf-8') as f:
-            analysis_data = json.load(f)
-        nodes = analysis_data.get('nodes', [])
-        edges = analysis_data.get('edges', [])
-        # ... (warnings for empty nodes/edges) ...
+        source = args.input_files[0] if len(args.input_files) == 1 else \
+            f"{len(args.input_files)} shards ({args.input_file})"
+        print(f"Loading JSON data from: {source}"
+              + (" (streaming)" if args.stream else ""), file=sys.stderr)
+        with metrics.stage("load"):
+            nodes, edges = load_graph(args.input_files, stream=args.stream, processes=args.parse_processes,
+                                      compact=args.compact, decoder=args.json_decoder)
+        if not args.stream:
+            # Streamed input is parsed lazily while writing, so only eager loads have a parse rate
+            input_bytes = sum(os.path.getsize(path) for path in args.input_files)
+            decoder = effective_json_decoder(args.input_files, args.json_decoder, args.compact)
+            metrics.record_parse(decoder, input_bytes, len(nodes) + len(edges), metrics.stages["load"])
+            print(f"Parsed {input_bytes / 1e6:.1f} MB ({len(nodes) + len(edges)} records) in "
+                  f"{metrics.stages['load']:.2f}s with {decoder}.", file=sys.stderr)
 
     except Exception as e:
         print(f"Error loading JSON file: {e}", file=sys.stderr)
-        sys.exit(1)
+        write_metrics(metrics, args)
+        return 1
+
+    # Validate and deduplicate before anything is written, so every node and relationship is sent once
+    if not args.skip_validation:
+        try:
+            with metrics.stage("validate"):
+                validation = validate_graph(nodes, edges, edge_counts=args.edge_counts)
+        except Exception as e:
+            print(f"Error validating JSON data: {e}", file=sys.stderr)
+            write_metrics(metrics, args)
+            return 1
+        validation.report()
+        nodes = validation.filter_nodes(nodes)
+        edges = validation.filter_edges(edges)
+
+    # Derived metrics become ordinary node properties, written by the same batches
+    if args.analytics:
+        try:
+            with metrics.stage("analytics"):
+                analytics = analyze_graph(nodes, edges, args.analytics_edge_types)
+        except Exception as e:
+            print(f"Error computing graph analytics: {e}", file=sys.stderr)
+            write_metrics(metrics, args)
+            return 1
+        analytics.report()
+        nodes = analytics.annotate_nodes(nodes)
+
+    # Offline mode: write neo4j-admin CSVs and stop before touching the database
+    if args.export_csv:
+        try:
+            with metrics.stage("export"):
+                export_admin_csv(nodes, edges, args.export_csv, args.database)
+        except Exception as e:
+            print(f"Error exporting CSV files: {e}", file=sys.stderr)
+            write_metrics(metrics, args)
+            return 1
+        metrics.success = True
+        write_metrics(metrics, args)
+        print(f"--- CSV export finished in {time.time() - metrics.started:.2f} seconds ---", file=sys.stderr)
+        return 0
+
+    # Checkpoint: continue a previous run with --resume, otherwise start a fresh one.
+    # Incremental runs always checkpoint and continue automatically: their delta is only
+    # reproducible against the same snapshot, so the fingerprint includes its generation.
+    checkpoint = None
+    snapshot = None
+    resuming = False
+    if args.incremental or args.use_checkpoint:
+        fingerprint = input_fingerprint(args.input_files)
+        if args.incremental:
+            snapshot = SnapshotStore(args.incremental)
+            fingerprint += (f"|snapshot:{snapshot.generation}"
+                            f"|reset:{int(bool(args.clear or args.recreate_database))}")
+        if args.incremental and not (args.clear or args.recreate_database):
+            # A checkpoint for the current snapshot state but another input means the last
+            # run failed partway: the database holds some of its writes, which a delta of the
+            # new input against the snapshot would not account for
+            stored = ImportCheckpoint.stored_fingerprint(args.checkpoint)
+            if stored not in (None, fingerprint) and f"|snapshot:{snapshot.generation}|" in stored:
+                print(f"Error: an earlier incremental run against '{args.incremental}' failed partway "
+                      f"(see '{args.checkpoint}') and the input has changed since, so the database no "
+                      "longer matches the snapshot. Re-run with the input of the failed run to finish "
+                      "it, or add --clear to re-import everything.", file=sys.stderr)
+                snapshot.close()
+                write_metrics(metrics, args)
+                return 1
+        if args.resume or args.incremental:
+            checkpoint = ImportCheckpoint.load(args.checkpoint, fingerprint)
+            resuming = checkpoint is not None
+            if checkpoint is None:
+                if args.resume:
+                    print(f"No usable checkpoint at '{args.checkpoint}'; starting from the beginning.",
+                          file=sys.stderr)
+            elif checkpoint.workers != (1 if args.use_async else args.workers):
+                if args.use_async:
+                    print(f"Error: checkpoint was written with --workers {checkpoint.workers}; "
+                          "resume without --async.", file=sys.stderr)
+                    return 1
+                print(f"Using --workers {checkpoint.workers} from the checkpoint "
+                      "(records are partitioned by worker count).", file=sys.stderr)
+                args.workers = checkpoint.workers
+            else:
+                print(f"Resuming from checkpoint '{args.checkpoint}'.", file=sys.stderr)
+        if checkpoint is None:
+            checkpoint = ImportCheckpoint(args.checkpoint, fingerprint, 1 if args.use_async else args.workers)
 
-    # 2. Connect to Neo4j (no changes needed here)
-    driver = None
+    # 2. Connect to Neo4j (or set up the selected sink)
+    owns_sink = sink is None
+    rejects = None
     try:
-        print(f"Connecting to Neo4j at {args.uri}...", file=sys.stderr)
-        # ... (rest of connection logic) ...
         auth_tuple = (args.user, args.password) if args.password else None
-        driver = GraphDatabase.driver(args.uri, auth=auth_tuple)
-        driver.verify_connectivity()
-        print("Neo4j connection successful.", file=sys.stderr)
+        if owns_sink:
+            with metrics.stage("connect"):
+                sink = open_sink(args, auth_tuple)
 
+        # 3. Clear (or recreate) the database if requested
+        if resuming and (args.clear or args.recreate_database):
+            print("Resuming: not clearing the database.", file=sys.stderr)
+        elif args.recreate_database:
+            with metrics.stage("clear"):
+                sink.recreate()
+        elif args.clear:
+            with metrics.stage("clear"):
+                sink.clear(args.clear_batch_size)
 
-        # 3. Clear database if requested (no changes needed here)
-        if args.clear:
-            clear_database(driver, args.database)
+        # 4. Create constraints for the configured or discovered labels
+        if sink.supports_constraints:
+            with metrics.stage("constraints"):
+                if args.labels:
+                    labels = [label.strip() for label in args.labels.split(",") if label.strip()]
+                else:
+                    labels = discover_node_labels(nodes)
+                sink.create_constraints(labels, args.index_timeout)
 
-        # 4. Create constraints (no changes needed here)
-        create_constraints(driver, args.database)
+        # 4b. Incremental mode: drop what disappeared and only write what changed
+        if args.incremental:
+            with metrics.stage("delta"):
+                delta = snapshot.diff(nodes, edges, reset=args.clear or args.recreate_database)
+            if delta.full:
+                print("No previous snapshot to compare with; importing everything.", file=sys.stderr)
+            else:
+                print(f"Delta: {len(delta.changed_node_ids)} added/changed nodes, "
+                      f"{len(delta.dropped_node_ids)} removed/relabelled nodes, "
+                      f"{sum(delta.edge_additions.values())} added and "
+                      f"{sum(row['count'] for row in delta.removed_edges)} removed relationships.",
+                      file=sys.stderr)
+                with metrics.stage("delete"):
+                    apply_deletions(sink, delta, args.db_batch_size, args.max_retries,
+                                    progress=checkpoint.phase('delete'))
+            nodes = delta.filter_nodes(nodes)
+            edges = delta.filter_edges(edges)
 
         # 5. Insert Nodes and Edges (pass batch_size from args)
-        insert_nodes(driver, args.database, nodes, args.db_batch_size) # Pass batch size
-        insert_edges(driver, args.database, edges, args.db_batch_size) # Pass batch size
+        # node_labels (id -> label) lets edge writes match endpoints by their own label. It
+        # holds every node id, so streamed imports match them through the CodeElement index
+        node_labels = None if args.stream else {}
+        rejects = RejectLog(args.rejects, args.max_rejects)
+        # Endpoints written in this run are then matched by elementId, skipping index lookups
+        element_ids = None if args.no_element_ids or not sink.supports_element_ids else ElementIdCache()
+        if args.use_async:
+            with metrics.stage("insert"):
+                asyncio.run(import_graph_async(
+                    args.uri, auth_tuple, args.database, nodes, edges, make_batch_sizer(args),
+                    label_index=node_labels, max_inflight=args.max_inflight, max_retries=args.max_retries,
+                    checkpoint=checkpoint, rejects=rejects, edge_batch_size=make_batch_sizer(args),
+                    element_ids=element_ids, metrics=metrics))
+        else:
+            with metrics.stage("insert"):
+                insert_nodes(sink, nodes, make_batch_sizer(args), label_index=node_labels,
+                             workers=args.workers, max_retries=args.max_retries,
+                             progress=checkpoint.phase('nodes') if checkpoint else None, rejects=rejects,
+                             element_ids=element_ids, metrics=metrics.phase('nodes'))
+                insert_edges(sink, edges, make_batch_sizer(args), label_index=node_labels,
+                             workers=args.workers, max_retries=args.max_retries,
+                             progress=checkpoint.phase('edges') if checkpoint else None, rejects=rejects,
+                             element_ids=element_ids, metrics=metrics.phase('edges'))
+        if rejects.count:
+            print(f"Warning: {rejects.count} records were rejected by the server; "
+                  f"see '{args.rejects}'.", file=sys.stderr)
+
+        # Record the imported state only once everything has been written. The new snapshot
+        # generation invalidates the checkpoint, so it is only removed afterwards.
+        if snapshot:
+            snapshot.commit()
+            print(f"Snapshot '{args.incremental}' updated.", file=sys.stderr)
+        if checkpoint:
+            checkpoint.remove()
+        metrics.success = True
 
     except Exception as e:
         print(f"\nAn error occurred during Neo4j processing: {e}", file=sys.stderr)
-        # ... (rest of error reporting) ...
-        sys.exit(1)
+        if checkpoint and checkpoint.started:
+            print(f"Progress is saved in '{args.checkpoint}'; re-run with "
+                  + ("the same arguments" if args.incremental else "--resume") + " to continue.", file=sys.stderr)
+        elif checkpoint is None and not args.incremental:
+            print("Run with --resume from the start to record progress that a rerun can continue from.",
+                  file=sys.stderr)
+        return 1
     finally:
         # 6. Close connection (no changes needed here)
-        if driver:
-            driver.close()
-            print("Neo4j connection closed.", file=sys.stderr)
+        if snapshot:
+            snapshot.close()
+        if rejects:
+            rejects.close()
+        if sink and owns_sink:
+            sink.close()
+        write_metrics(metrics, args)
 
-    end_time = time.time()
-    print(f"--- Neo4j population finished successfully in {end_time - start_time:.2f} seconds ---", file=sys.stderr)
-    sys.exit(0)
\ No newline at end of file
+    print(f"--- Neo4j population finished successfully in {time.time() - metrics.started:.2f} seconds ---",
+          file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    print("--- Starting Neo4j Population ---", file=sys.stderr)
+    sys.exit(run_import(parse_arguments(), ImportMetrics()))
@@ -0,0 +1,596 @@
+"""Tests for populate_graph.py.
+
+Whole imports run through run_import against the in-memory sink (or the CSV
+export), so no server is needed; the parsing, storage, batching and
+analytics building blocks are tested directly.
+"""
+
+import csv
+import gzip
+import io
+import json
+import lzma
+import os
+import sys
+
+import pytest
+
+import populate_graph
+
+
+def make_graph(count, extra_edges=0):
+    """A ring of Method nodes linked by CALLS, plus extra_edges USES shortcuts."""
+    nodes = [{"id": f"m{i}", "type": "Method", "name": f"method{i}"} for i in range(count)]
+    edges = [{"sourceId": f"m{i}", "targetId": f"m{(i + 1) % count}", "type": "CALLS", "line": i}
+             for i in range(count)]
+    edges += [{"sourceId": f"m{i}", "targetId": f"m{(i + 2) % count}", "type": "USES"}
+              for i in range(extra_edges)]
+    return {"nodes": nodes, "edges": edges}
+
+
+def write_graph(path, graph):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(graph, f)
+    return str(path)
+
+
+def run(monkeypatch, *argv, sink=None):
+    monkeypatch.setattr(sys, "argv", ["populate_graph.py", *argv])
+    args = populate_graph.parse_arguments()
+    return populate_graph.run_import(args, populate_graph.ImportMetrics(), sink=sink)
+
+
+class FailingSink(populate_graph.MemoryGraphSink):
+    """Memory sink whose edge batch number fail_at raises a fatal error."""
+
+    def __init__(self, fail_at=None):
+        super().__init__()
+        self.fail_at = fail_at
+        self.edge_batches = 0
+
+    @staticmethod
+    def write_edges(sink, groups):
+        sink.edge_batches += 1
+        if sink.edge_batches == sink.fail_at:
+            raise RuntimeError("connection dropped")
+        return populate_graph.MemoryGraphSink.write_edges(sink, groups)
+
+
+def edge_set(sink):
+    return sorted(edge[:3] for edge in sink.edges)
+
+
+# --- CSV export ---
+
+def read_rows(path):
+    with open(path, newline="", encoding="utf-8") as f:
+        return list(csv.reader(f))
+
+
+def test_export_csv_writes_headers_data_and_script(tmp_path, monkeypatch):
+    input_file = write_graph(tmp_path / "graph.json", {
+        "nodes": [
+            {"id": "c1", "type": "class", "name": "A", "loc": 10},
+            {"id": "m1", "type": "Method", "name": "f", "isStatic": True},
+            {"id": "m2", "type": "Method", "name": "g", "isStatic": False},
+        ],
+        "edges": [
+            {"sourceId": "c1", "targetId": "m1", "type": "CONTAINS"},
+            {"sourceId": "m1", "targetId": "m2", "type": "CALLS", "line": 4},
+        ],
+    })
+    out_dir = tmp_path / "import"
+
+    assert run(monkeypatch, input_file, "--export-csv", str(out_dir)) == 0
+
+    assert read_rows(out_dir / "nodes_Class.header.csv") == [
+        ["id:ID", "type:string", "name:string", "loc:long", ":LABEL"]]
+    assert read_rows(out_dir / "nodes_Class.csv") == [["c1", "class", "A", "10", "Class;CodeElement"]]
+    assert read_rows(out_dir / "nodes_Method.header.csv") == [
+        ["id:ID", "type:string", "name:string", "isStatic:boolean", ":LABEL"]]
+    assert read_rows(out_dir / "nodes_Method.csv") == [
+        ["m1", "Method", "f", "true", "Method;CodeElement"],
+        ["m2", "Method", "g", "false", "Method;CodeElement"],
+    ]
+    assert read_rows(out_dir / "rels_CALLS.header.csv") == [[":START_ID", "line:long", ":END_ID", ":TYPE"]]
+    assert read_rows(out_dir / "rels_CALLS.csv") == [["m1", "4", "m2", "CALLS"]]
+    assert read_rows(out_dir / "rels_CONTAINS.header.csv") == [[":START_ID", ":END_ID", ":TYPE"]]
+    assert read_rows(out_dir / "rels_CONTAINS.csv") == [["c1", "m1", "CONTAINS"]]
+
+    script = (out_dir / "neo4j-admin-import.sh").read_text(encoding="utf-8")
+    assert script.startswith("#!/bin/sh\n")
+    command = script.splitlines()[-1]
+    assert command.startswith("neo4j-admin database import full neo4j ")
+    for stem in ("nodes_Class", "nodes_Method"):
+        assert f"--nodes={out_dir / stem}.header.csv,{out_dir / stem}.csv" in command
+    for stem in ("rels_CALLS", "rels_CONTAINS"):
+        assert f"--relationships={out_dir / stem}.header.csv,{out_dir / stem}.csv" in command
+
+
+# --- Validation and deduplication ---
+
+def test_import_into_memory_sink(tmp_path, monkeypatch):
+    graph = make_graph(25, extra_edges=5)
+    graph["edges"].append(dict(graph["edges"][0]))                  # exact duplicate: collapsed
+    graph["edges"].append(dict(graph["edges"][0], line=99))         # another call site: kept
+    graph["edges"].append({"sourceId": "m0", "targetId": "missing", "type": "CALLS"})  # dangling
+    input_file = write_graph(tmp_path / "graph.json", graph)
+    sink = populate_graph.MemoryGraphSink()
+
+    assert run(monkeypatch, input_file, "--sink", "memory", "--db-batch-size", "7", sink=sink) == 0
+
+    assert len(sink.nodes) == 25
+    assert sink.nodes["m3"] == ("Method", {"id": "m3", "type": "Method", "name": "method3"})
+    assert len(sink.edges) == 25 + 5 + 1
+    assert sorted(edge[3]["line"] for edge in sink.edges if edge[:3] == ("m0", "CALLS", "m1")) == [0, 99]
+
+
+def test_id_hashes_keep_types_apart():
+    hashes = {populate_graph._hash64(value) for value in ("5", 5, "null", None, "true", True, 5.0, "[5]", [5])}
+    assert len(hashes) == 9
+
+
+def test_edge_key_ignores_property_order_but_not_values():
+    edge = {"sourceId": "a", "targetId": "b", "type": "calls", "line": 3, "column": 7}
+    reordered = {"column": 7, "line": 3, "type": "CALLS", "targetId": "b", "sourceId": "a"}
+    assert populate_graph.edge_key(edge) == populate_graph.edge_key(reordered)
+    assert populate_graph.edge_key(edge) != populate_graph.edge_key(dict(edge, line=4))
+    assert populate_graph.edge_key(edge) != populate_graph.edge_key(dict(edge, sourceId="b", targetId="a"))
+
+
+# --- Checkpoints and resume ---
+
+@pytest.mark.parametrize("workers", ["1", "3"])
+def test_resume_continues_without_duplicating_relationships(tmp_path, monkeypatch, workers):
+    input_file = write_graph(tmp_path / "graph.json", make_graph(60))
+    argv = [input_file, "--sink", "memory", "--db-batch-size", "10", "--workers", workers, "--resume"]
+    sink = FailingSink(fail_at=3)
+
+    assert run(monkeypatch, *argv, sink=sink) == 1
+    assert os.path.exists(input_file + ".checkpoint.json")
+    assert len(sink.edges) < 60
+
+    sink.fail_at = None
+    assert run(monkeypatch, *argv, sink=sink) == 0
+    assert len(sink.nodes) == 60
+    assert edge_set(sink) == sorted(set(edge_set(sink)))
+    assert len(sink.edges) == 60
+    assert not os.path.exists(input_file + ".checkpoint.json")
+
+
+# --- Bisecting refused batches ---
+
+def test_bisect_rejects_only_the_refused_records(tmp_path, monkeypatch):
+    graph = make_graph(40)
+    graph["edges"] = []
+    # A node cannot change its label, so the Class copies of these ids are refused
+    graph["nodes"] += [{"id": f"m{i}", "type": "Class"} for i in (3, 17, 31)]
+    input_file = write_graph(tmp_path / "graph.json", graph)
+    rejects_file = tmp_path / "rejects.jsonl"
+    sink = populate_graph.MemoryGraphSink()
+
+    status = run(monkeypatch, input_file, "--sink", "memory", "--db-batch-size", "16", "--skip-validation",
+                 "--rejects", str(rejects_file), sink=sink)
+
+    assert status == 0
+    with open(rejects_file, encoding="utf-8") as f:
+        rejected = [json.loads(line) for line in f]
+    assert sorted(entry["record"]["id"] for entry in rejected) == ["m17", "m3", "m31"]
+    assert all(entry["record"]["type"] == "Class" for entry in rejected)
+    assert len(sink.nodes) == 40
+    assert all(label == "Method" for label, _ in sink.nodes.values())
+
+
+# --- Incremental import ---
+
+def test_incremental_imports_only_the_delta(tmp_path, monkeypatch):
+    input_file = tmp_path / "graph.json"
+    snapshot = str(tmp_path / "graph.snapshot.db")
+    argv = [str(input_file), "--sink", "memory", "--db-batch-size", "10", "--incremental", snapshot]
+    sink = populate_graph.MemoryGraphSink()
+
+    write_graph(input_file, make_graph(30, extra_edges=10))
+    assert run(monkeypatch, *argv, sink=sink) == 0
+    assert (len(sink.nodes), len(sink.edges)) == (30, 40)
+
+    graph = make_graph(30, extra_edges=4)
+    graph["nodes"][5]["name"] = "renamed"
+    write_graph(input_file, graph)
+    metrics_file = tmp_path / "metrics.json"
+    assert run(monkeypatch, *argv, "--metrics-json", str(metrics_file), sink=sink) == 0
+    assert sink.nodes["m5"][1]["name"] == "renamed"
+    assert edge_set(sink) == sorted((e["sourceId"], e["type"], e["targetId"]) for e in graph["edges"])
+    with open(metrics_file, encoding="utf-8") as f:
+        phases = json.load(f)["phases"]
+    assert phases["nodes"]["rows"] == 1
+
+
+def test_incremental_rerun_after_failure_does_not_duplicate_relationships(tmp_path, monkeypatch):
+    input_file = tmp_path / "graph.json"
+    snapshot = str(tmp_path / "graph.snapshot.db")
+    argv = [str(input_file), "--sink", "memory", "--db-batch-size", "10", "--incremental", snapshot]
+    sink = FailingSink()
+
+    write_graph(input_file, make_graph(40))
+    assert run(monkeypatch, *argv, sink=sink) == 0
+
+    graph = make_graph(40, extra_edges=30)
+    del graph["edges"][:5]  # five removed CALLS relationships
+    write_graph(input_file, graph)
+    sink.fail_at = sink.edge_batches + 3
+    assert run(monkeypatch, *argv, sink=sink) == 1
+    assert os.path.exists(snapshot + ".checkpoint.json")
+
+    sink.fail_at = None
+    assert run(monkeypatch, *argv, sink=sink) == 0
+    assert len(sink.edges) == 65
+    assert edge_set(sink) == sorted((e["sourceId"], e["type"], e["targetId"]) for e in graph["edges"])
+    assert not os.path.exists(snapshot + ".checkpoint.json")
+
+
+def test_incremental_deletes_the_relationship_whose_properties_changed(tmp_path, monkeypatch):
+    input_file = tmp_path / "graph.json"
+    snapshot = str(tmp_path / "graph.snapshot.db")
+    argv = [str(input_file), "--sink", "memory", "--incremental", snapshot]
+    sink = populate_graph.MemoryGraphSink()
+    nodes = [{"id": "a", "type": "Method"}, {"id": "b", "type": "Method"}]
+
+    def calls(*lines):
+        return [{"sourceId": "a", "targetId": "b", "type": "CALLS", "line": line} for line in lines]
+
+    write_graph(input_file, {"nodes": nodes, "edges": calls(10, 20)})
+    assert run(monkeypatch, *argv, sink=sink) == 0
+    write_graph(input_file, {"nodes": nodes, "edges": calls(10, 30)})
+    assert run(monkeypatch, *argv, sink=sink) == 0
+
+    assert sorted(edge[3]["line"] for edge in sink.edges) == [10, 30]
+
+
+def test_incremental_refuses_a_changed_input_after_a_failed_run(tmp_path, monkeypatch):
+    input_file = tmp_path / "graph.json"
+    snapshot = str(tmp_path / "graph.snapshot.db")
+    argv = [str(input_file), "--sink", "memory", "--db-batch-size", "10", "--incremental", snapshot]
+    sink = FailingSink()
+
+    write_graph(input_file, make_graph(40))
+    assert run(monkeypatch, *argv, sink=sink) == 0
+    write_graph(input_file, make_graph(40, extra_edges=30))
+    sink.fail_at = sink.edge_batches + 3
+    assert run(monkeypatch, *argv, sink=sink) == 1
+
+    sink.fail_at = None
+    graph = make_graph(40, extra_edges=30)
+    graph["nodes"][7]["name"] = "renamed"
+    write_graph(input_file, graph)
+    written = list(sink.edges)
+    assert run(monkeypatch, *argv, sink=sink) == 1
+    assert sink.edges == written
+
+    assert run(monkeypatch, *argv, "--clear", sink=sink) == 0
+    assert len(sink.edges) == 70
+    assert sink.nodes["m7"][1]["name"] == "renamed"
+    assert run(monkeypatch, *argv, sink=sink) == 0
+    assert len(sink.edges) == 70
+
+
+# --- Streaming JSON reader ---
+
+STREAM_DOCUMENT = {
+    "meta": {"skipped": [1, [2, 3], {"x": "y"}]},
+    "nodes": [
+        {"id": "né\\\"1", "type": "Method", "loc": 12345, "ratio": -1.5e-3, "big": 12345678901234567890},
+        {"id": "n2", "type": "Class", "flags": [True, False, None], "doc": "line\nbreak 😀"},
+        [], {}, 0, "", 3.25,
+    ],
+    "edges": [],
+}
+
+
+class CountingReader(io.StringIO):
+    """StringIO that remembers how many characters were read from it."""
+
+    consumed = 0
+
+    def read(self, size=-1):
+        data = super().read(size)
+        self.consumed += len(data)
+        return data
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 5, 7, 16, 64, 1 << 20])
+def test_stream_reader_handles_values_split_across_chunks(chunk_size):
+    for separators in ((",", ":"), (", ", ": ")):
+        text = json.dumps(STREAM_DOCUMENT, separators=separators, ensure_ascii=False)
+        reader = populate_graph.JsonStreamReader(io.StringIO(text), chunk_size=chunk_size)
+        assert list(reader.iter_top_level_array("nodes")) == STREAM_DOCUMENT["nodes"]
+
+
+def test_stream_reader_reports_syntax_errors_without_reading_the_rest():
+    good = json.dumps({"id": "n", "type": "Method", "name": "x" * 40})
+    text = '{"nodes": [' + good + ', {"id": "bad",, "type": "Method"}, ' + ", ".join([good] * 5000) + "]}"
+    source = CountingReader(text)
+    reader = populate_graph.JsonStreamReader(source, chunk_size=1024)
+
+    with pytest.raises(ValueError) as error:
+        list(reader.iter_top_level_array("nodes"))
+
+    assert f"at character {text.index(',, ') + 1}" in str(error.value)
+    assert source.consumed <= 2 * 1024
+
+
+# --- JSON decoders ---
+
+@pytest.mark.parametrize("compact, expected", [(False, "orjson"), (True, "json")])
+def test_parse_metrics_name_the_decoder_that_ran(tmp_path, monkeypatch, compact, expected):
+    pytest.importorskip("orjson")
+    input_file = write_graph(tmp_path / "graph.json", make_graph(5))
+    metrics_file = tmp_path / "metrics.json"
+    argv = [input_file, "--sink", "null", "--json-decoder", "orjson", "--metrics-json", str(metrics_file)]
+
+    assert run(monkeypatch, *argv, *(["--compact"] if compact else [])) == 0
+
+    with open(metrics_file, encoding="utf-8") as f:
+        assert json.load(f)["parse"]["decoder"] == expected
+
+
+def test_effective_json_decoder_of_compact_ndjson_shards():
+    paths = ["a.json", "b.ndjson.gz"]
+    assert populate_graph.effective_json_decoder(paths, "orjson") == "orjson"
+    assert populate_graph.effective_json_decoder(paths, "orjson", compact=True) == "json+orjson"
+    assert populate_graph.effective_json_decoder(paths[1:], "orjson", compact=True) == "orjson"
+
+
+# --- NDJSON and compressed input ---
+
+NDJSON_GRAPH = {
+    "nodes": [{"id": "c1", "type": "Class", "name": "A"}, {"id": "m1", "type": "Method", "loc": 3},
+              {"id": "m2", "type": "Method", "loc": 4, "tags": ["x", "y"]}],
+    "edges": [{"sourceId": "c1", "targetId": "m1", "type": "CONTAINS"},
+              {"sourceId": "m1", "targetId": "m2", "type": "CALLS", "line": 9}],
+}
+
+
+def write_ndjson(path, graph, opener=open):
+    with opener(path, "wt", encoding="utf-8") as f:
+        for record in graph["nodes"] + graph["edges"]:
+            f.write(json.dumps(record) + "\n\n")
+    return str(path)
+
+
+@pytest.mark.parametrize("name, opener", [
+    ("graph.ndjson", open),
+    ("graph.jsonl.gz", gzip.open),
+    ("graph.ndjson.xz", lzma.open),
+])
+@pytest.mark.parametrize("mode", [{}, {"stream": True}, {"compact": True}])
+def test_ndjson_input_in_every_mode(tmp_path, name, opener, mode):
+    path = write_ndjson(tmp_path / name, NDJSON_GRAPH, opener)
+
+    nodes, edges = populate_graph.load_graph([path], **mode)
+
+    assert list(nodes) == NDJSON_GRAPH["nodes"]
+    assert list(edges) == NDJSON_GRAPH["edges"]
+
+
+@pytest.mark.parametrize("opener", [gzip.open, lzma.open])
+def test_compressed_json_document_is_recognized_by_content(tmp_path, opener):
+    path = tmp_path / "graph.json"
+    with opener(path, "wt", encoding="utf-8") as f:
+        json.dump(NDJSON_GRAPH, f)
+
+    for mode in ({}, {"stream": True}):
+        nodes, edges = populate_graph.load_graph([str(path)], **mode)
+        assert list(nodes) == NDJSON_GRAPH["nodes"]
+        assert list(edges) == NDJSON_GRAPH["edges"]
+
+
+def test_zstd_ndjson_input(tmp_path):
+    zstandard = pytest.importorskip("zstandard")
+    path = tmp_path / "graph.ndjson.zst"
+    lines = "".join(json.dumps(record) + "\n" for record in NDJSON_GRAPH["nodes"] + NDJSON_GRAPH["edges"])
+    path.write_bytes(zstandard.ZstdCompressor().compress(lines.encode("utf-8")))
+
+    nodes, edges = populate_graph.load_graph([str(path)], stream=True)
+
+    assert list(nodes) == NDJSON_GRAPH["nodes"]
+    assert list(edges) == NDJSON_GRAPH["edges"]
+
+
+def test_ndjson_errors_name_the_line(tmp_path):
+    path = tmp_path / "graph.ndjson"
+    path.write_text('{"id": "a", "type": "Method"}\n\n{"id": "b",\n', encoding="utf-8")
+
+    with pytest.raises(ValueError, match="line 3"):
+        list(populate_graph.iter_ndjson(str(path)))
+
+
+# --- Compact store ---
+
+def test_property_column_switches_from_int64_to_list_without_losing_values():
+    column = populate_graph.PropertyColumn()
+    column.set(0, 5)
+    column.set(2, -7)
+    assert isinstance(column.values, populate_graph.array)
+    column.set(3, "text")
+    column.set(5, None)
+    column.set(6, 1 << 70)
+
+    assert not isinstance(column.values, populate_graph.array)
+    values = [column.get(row) for row in range(8)]
+    missing = populate_graph._MISSING
+    assert values == [5, missing, -7, "text", missing, None, 1 << 70, missing]
+
+
+@pytest.mark.parametrize("value", [True, 2.5, populate_graph.INT64_MISSING, 1 << 63, [1, 2]])
+def test_property_column_keeps_values_an_int64_array_cannot_hold(value):
+    column = populate_graph.PropertyColumn()
+    column.set(0, 1)
+    column.set(1, value)
+    assert column.get(0) == 1
+    assert column.get(1) == value and type(column.get(1)) is type(value)
+
+
+def test_compact_records_round_trip():
+    records = [
+        {"id": "m1", "type": "Method", "loc": 10, "name": "f"},
+        {"id": "m2", "type": "Method", "name": None},
+        {"type": "Class", "flags": [1, 2], "loc": 2.5},
+        {"id": ["unhashable"], "type": "Method"},
+        {"id": 7},
+        {},
+    ]
+    graph = populate_graph.CompactGraph()
+    graph.nodes.extend(records)
+
+    assert len(graph.nodes) == len(records)
+    assert list(graph.nodes) == records
+    assert list(graph.nodes) == records  # Re-iterable
+    assert graph.nodes.record(1) == records[1]
+
+
+def test_compact_graph_shares_ids_between_nodes_and_edges():
+    graph = populate_graph.CompactGraph()
+    graph.nodes.extend([{"id": "a", "type": "Method"}, {"id": "b", "type": "Method"}])
+    edges = [{"sourceId": "a", "targetId": "b", "type": "CALLS", "line": 4},
+             {"sourceId": "b", "targetId": "a", "type": "CALLS"}]
+    graph.edges.extend(edges)
+
+    assert list(graph.edges) == edges
+    assert len(graph.ids) == 2
+    assert list(graph.edges.codes["sourceId"]) == [0, 1]
+    assert isinstance(graph.edges.columns["line"].values, populate_graph.array)
+
+
+def test_compact_load_matches_the_eager_load(tmp_path):
+    graph = make_graph(30, extra_edges=10)
+    graph["nodes"][3]["tags"] = ["a", "b"]
+    graph["nodes"][4]["loc"] = 12
+    path = write_graph(tmp_path / "graph.json", graph)
+
+    nodes, edges = populate_graph.load_graph([path], compact=True)
+
+    assert list(nodes) == graph["nodes"]
+    assert list(edges) == graph["edges"]
+
+
+# --- Adaptive batch sizing ---
+
+def test_adaptive_sizer_clamps_the_initial_row_target():
+    assert populate_graph.AdaptiveBatchSizer(1, min_rows=10, max_rows=100).rows == 10
+    assert populate_graph.AdaptiveBatchSizer(1000, min_rows=10, max_rows=100).rows == 100
+
+
+def test_adaptive_sizer_moves_at_most_a_factor_of_two_per_commit():
+    fast = populate_graph.AdaptiveBatchSizer(100, target_latency=1.0)
+    fast.observe(100, 0.001)
+    assert fast.rows == 200
+
+    slow = populate_graph.AdaptiveBatchSizer(1000, target_latency=1.0)
+    slow.observe(1000, 100.0)
+    assert slow.rows == 500
+
+    slow.observe(0, 1.0)
+    slow.observe(10, 0.0)
+    assert slow.rows == 500
+
+
+def test_adaptive_sizer_converges_to_the_target_latency():
+    rows_per_second = 4000
+    sizer = populate_graph.AdaptiveBatchSizer(100, target_latency=0.5, max_rows=100000)
+    for _ in range(30):
+        sizer.observe(sizer.rows, sizer.rows / rows_per_second)
+    assert sizer.rows == pytest.approx(rows_per_second * 0.5, rel=0.01)
+
+
+def test_adaptive_sizer_shrinks_on_memory_errors_down_to_its_floors():
+    sizer = populate_graph.AdaptiveBatchSizer(400, max_bytes=1 << 20, min_rows=10)
+    sizer.shrink()
+    assert (sizer.rows, sizer.max_bytes) == (200, 1 << 19)
+    for _ in range(20):
+        sizer.shrink()
+    assert (sizer.rows, sizer.max_bytes) == (10, 64 * 1024)
+
+
+def test_adaptive_sizer_closes_batches_at_the_byte_cap():
+    small = [{"id": f"s{i}", "type": "Namespace"} for i in range(50)]
+    large = [{"id": f"l{i}", "type": "Method", "source": "x" * 1000} for i in range(50)]
+    sizer = populate_graph.AdaptiveBatchSizer(40, max_bytes=5000, min_rows=10)
+
+    batches = list(populate_graph.index_batches(small + large, sizer))
+
+    sizes = [len(batch) for batch, _, _ in batches]
+    assert sum(sizes) == 100
+    assert sizes[0] == 40                             # Small records: row target first
+    assert max(sizes[2:]) <= 5                        # Large records: byte cap first
+    assert [(start, end) for _, start, end in batches][0] == (0, 40)
+
+
+# --- Graph analytics ---
+
+def analyse(edge_list, node_ids=None, edge_types=None, node_types=None):
+    node_ids = node_ids or sorted({v for edge in edge_list for v in edge[:2]})
+    nodes = [{"id": v, "type": (node_types or {}).get(v, "Method")} for v in node_ids]
+    edges = [{"sourceId": edge[0], "targetId": edge[1], "type": edge[2] if len(edge) > 2 else "CALLS"}
+             for edge in edge_list]
+    analytics = populate_graph.analyze_graph(nodes, edges, edge_types)
+    return {node["id"]: analytics.node_properties(node) for node in nodes}
+
+
+def test_analytics_components_and_recursion():
+    props = analyse([("a", "b"), ("b", "c"), ("c", "a"), ("c", "d"), ("d", "d"), ("d", "e")],
+                    node_ids=["a", "b", "c", "d", "e", "f"])
+
+    assert len({props[v]["sccId"] for v in "abc"}) == 1
+    assert len({props[v]["sccId"] for v in "abcdef"}) == 4
+    assert [props[v]["sccSize"] for v in "abcdef"] == [3, 3, 3, 1, 1, 1]
+    assert [props[v]["recursive"] for v in "abcdef"] == [True, True, True, True, False, False]
+    assert [(props[v]["fanIn"], props[v]["fanOut"]) for v in "cdf"] == [(1, 2), (2, 2), (0, 0)]
+
+
+def test_analytics_topological_layers_use_the_longest_path_through_collapsed_cycles():
+    props = analyse([("x", "a"), ("a", "b"), ("b", "a"), ("b", "c"), ("x", "c"), ("c", "d"), ("y", "d")])
+
+    layers = {v: props[v]["topoLayer"] for v in props}
+    assert layers == {"x": 0, "y": 0, "a": 1, "b": 1, "c": 2, "d": 3}
+
+
+def test_analytics_handle_long_chains_without_recursion():
+    count = 20000
+    props = analyse([(f"n{i}", f"n{i + 1}") for i in range(count)] + [(f"n{count}", "n0")])
+
+    assert props["n0"]["sccSize"] == count + 1
+    assert all(p["recursive"] for p in props.values())
+
+
+def reference_page_rank(node_ids, edge_list, damping=0.85, iterations=1000):
+    n = len(node_ids)
+    out = {v: [t for s, t in edge_list if s == v] for v in node_ids}
+    rank = {v: 1.0 / n for v in node_ids}
+    for _ in range(iterations):
+        dangling = sum(rank[v] for v in node_ids if not out[v])
+        new = {v: (1 - damping + damping * dangling) / n for v in node_ids}
+        for v in node_ids:
+            for t in out[v]:
+                new[t] += damping * rank[v] / len(out[v])
+        rank = new
+    return rank
+
+
+def test_analytics_page_rank_matches_a_reference_power_iteration():
+    edge_list = [("a", "b"), ("a", "c"), ("b", "c"), ("c", "a"), ("d", "c"), ("c", "e"), ("e", "e"), ("a", "f")]
+    node_ids = ["a", "b", "c", "d", "e", "f", "g"]
+
+    props = analyse(edge_list, node_ids=node_ids)
+
+    expected = reference_page_rank(node_ids, edge_list)
+    assert sum(props[v]["pageRank"] for v in node_ids) == pytest.approx(1.0, abs=1e-9)
+    for v in node_ids:
+        assert props[v]["pageRank"] == pytest.approx(expected[v], abs=1e-5)
+
+
+def test_analytics_restricted_to_edge_types_only_annotate_the_labels_they_connect():
+    props = analyse([("m1", "m2", "CALLS"), ("c1", "m1", "CONTAINS")], edge_types={"CALLS"},
+                    node_types={"c1": "Class"})
+
+    assert props["c1"] is None
+    assert (props["m1"]["fanOut"], props["m2"]["fanIn"]) == (1, 1)